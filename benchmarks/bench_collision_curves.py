@@ -0,0 +1,163 @@
+"""
+benchmarks of the generator and drawer hot paths on synthetic envelopes
+
+    python benchmarks/bench_collision_curves.py --save baseline.json
+    python benchmarks/bench_collision_curves.py --compare baseline.json
+
+reports build time, per-query latency, per-frame render time and peak memory,
+--compare exits with 1 when a timing regressed by more than --tolerance against the baseline
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import collision_curves_p.collision_curves_generator_m as ccg
+import collision_curves_p.collision_curves_drawer_m as ccd
+import collision_curves_p.collision_curves_index_m as cci
+
+
+# (envelope rows, curve sizes), rows * curve_size is capped so the dense cases stay within memory
+ENVELOPE_ROWS = [15, 1000, 100000]
+CURVE_SIZES   = [2, 10, 100, 500]
+MAX_CELLS     = 5_000_000
+QUICK_ROWS    = [15, 1000]
+QUICK_SIZES   = [2, 10]
+
+
+def make_envelope_csv(rows, closing):
+    """
+    V shaped envelope over -300..300 like data/noah_rt_*, closing moves the down limit up at large tilts
+    """
+    angle = np.linspace(-300, 300, rows)
+    down = 380.7 - 0.0025 * angle**2 * closing
+    upper = np.where(np.abs(angle) > 250, 90.7 + (np.abs(angle) - 250), 90.7)
+    buffer = io.StringIO()
+    pd.DataFrame({ 'Angle': angle, 'Upper': upper, 'Down': np.maximum(down, upper) }).to_csv(buffer, index=False)
+    buffer.seek(0)
+    return buffer
+
+
+def make_generator(rows):
+    return ccg.collision_curves_generator(make_envelope_csv(rows, 1.0), make_envelope_csv(rows, 0.5))
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def bench_case(rows, curve_size, repeat):
+    generator = make_generator(rows)
+    drawer = ccd.collision_curves_drawer(0, 100, 150, 400, 300, generator, True)
+
+    def build():
+        generator.invalidate_cache()
+        generator.build_collision_curves(curve_size)
+
+    result = {}
+    result['build_s'] = best_of(build, repeat)
+
+    tracemalloc.start()
+    build()
+    result['build_peak_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+
+    result['cached_build_s'] = best_of(lambda: generator.build_collision_curves(curve_size), repeat)
+
+    index = generator.m_collision_curves_index
+    angles = np.random.default_rng(0).uniform(-300, 300, 1000)
+    result['query_is_colliding_us'] = best_of(lambda: [index.is_colliding(curve_size // 2, angle, 300.0, 400.0) for angle in angles.tolist()], repeat) / len(angles) * 1e6
+
+    [upper, down] = [index.m_limits[curve_size // 2, :, 0], index.m_limits[curve_size // 2, :, 1]]
+    verticals = np.arange(90, 401) + 0.7
+    # one vertical at a time, like the debug marks of calculate_frame
+    result['query_gantry_window_us'] = best_of(lambda: [cci.calculate_gantry_windows(index.m_angles, upper, down, [vertical]) for vertical in verticals[::10]], repeat) / len(verticals[::10]) * 1e6
+    result['gantry_windows_s'] = best_of(lambda: index.gantry_windows(curve_size // 2, verticals), repeat)
+
+    samples = 100000
+    sample_angles = np.random.default_rng(1).uniform(-300, 300, samples)
+    result['check_collisions_per_sample_us'] = best_of(lambda: drawer.check_collisions(sample_angles, 300.0, 40.0, 'Auto', curve_size=curve_size), repeat) / samples * 1e6
+
+    # frame = calculate_frame + in place artist update + full Agg draw, without PNG encoding
+    renderer = drawer.get_renderer(headless=True)
+    def frame():
+        for angle in range(-300, 301, 60):
+            renderer.draw_frame(drawer.calculate_frame(False, curve_size, (10, 60), 400, 'Auto', 15, angle, 300))
+            renderer.m_figure.canvas.draw()
+    result['frame_s'] = best_of(frame, repeat) / len(range(-300, 301, 60))
+    return result
+
+
+def run(quick, repeat):
+    results = {}
+    for rows in (QUICK_ROWS if quick else ENVELOPE_ROWS):
+        for curve_size in (QUICK_SIZES if quick else CURVE_SIZES):
+            if rows * curve_size > MAX_CELLS:
+                continue
+            name = f'rows={rows},curve_size={curve_size}'
+            results[name] = bench_case(rows, curve_size, repeat)
+            print(name, ' '.join(f'{metric}={value:.4g}' for [metric, value] in results[name].items()), flush=True)
+    return { 'machine': { 'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+                        'platform': platform.platform(), 'processor': platform.processor() },
+            'results': results }
+
+
+def compare(current, baseline, tolerance):
+    """
+    prints current/baseline ratios, returns the regressed (case, metric) pairs
+    """
+    regressions = []
+    for [name, metrics] in current['results'].items():
+        if name not in baseline['results']:
+            continue
+        for [metric, value] in metrics.items():
+            reference = baseline['results'][name].get(metric)
+            # memory and time alike, smaller is better
+            if reference is None or reference <= 0:
+                continue
+            ratio = value / reference
+            flag = ''
+            if ratio > 1 + tolerance:
+                flag = '  <-- regression'
+                regressions.append([name, metric])
+            print(f'{name:32} {metric:34} {reference:12.4g} -> {value:12.4g}  x{ratio:.2f}{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quick', action='store_true', help='only the small envelopes and curve sizes')
+    parser.add_argument('--repeat', type=int, default=3, help='best of N runs per measurement')
+    parser.add_argument('--save', help='write the results as a json baseline')
+    parser.add_argument('--compare', help='json baseline to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown ratio before a metric counts as regressed')
+    args = parser.parse_args()
+
+    current = run(args.quick, args.repeat)
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(current, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if compare(current, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,2 +1,36 @@
-from collision_curves_p.collision_curves_drawer_m import *
-from collision_curves_p.collision_curves_generator_m import *
\ No newline at end of file
+# the modules are imported on first use, so importing the package does not pull in
+# ipywidgets, pylab or scipy for headless users
+import importlib
+
+_exports = {
+    'collision_curves_drawer_m':    ['collision_curves_drawer'],
+    'collision_curves_generator_m': ['collision_curves_generator'],
+    'collision_curves_index_m':     ['pick_up_continuous_runs', 'calculate_gantry_windows', 'collision_curves_index'],
+    'collision_curves_interpolator_m': ['collision_curves_interpolator', 'collision_curves_frames'],
+    'collision_curves_renderer_m':  ['collision_curves_renderer'],
+    'collision_curves_debouncer_m': ['collision_curves_debouncer'],
+    'collision_curves_map_m':       ['calculate_map_rows', 'collision_curves_map_generator', 'collision_curves_map_viewer'],
+    'collision_curves_profiler_m':  ['collision_curves_profiler', 'profiler'],
+    'collision_curves_optimizer_m': ['range_min', 'score_motion_windows', 'collision_curves_window_optimizer'],
+    'collision_curves_batch_m':     ['attach_shared_envelopes', 'run_variant', 'read_manifest', 'run_batch'],
+    'collision_curves_monitor_m':   ['collision_event', 'parse_telemetry_line', 'read_telemetry_log', 'replay_telemetry_server', 'collision_curves_monitor'],
+    'collision_curves_loader_m':    ['ENVELOPE_COLUMNS', 'ENVELOPE_DECIMALS', 'read_collision_envelope_csv', 'validate_collision_envelope',
+                                     'validate_collision_envelopes', 'load_collision_envelope', 'save_collision_envelope', 'convert_collision_envelope'],
+}
+_modules = { name: module for [module, names] in _exports.items() for name in names }
+
+__all__ = list(_modules)
+
+
+def __getattr__(name):
+    if name in _modules:
+        value = getattr(importlib.import_module(f'{__name__}.{_modules[name]}'), name)
+        globals()[name] = value
+        return value
+    if name in _exports:
+        return importlib.import_module(f'{__name__}.{name}')
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
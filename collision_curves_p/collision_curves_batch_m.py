@@ -0,0 +1,222 @@
+"""
+headless collision analyses of many machine variants in parallel worker processes
+
+    python -m collision_curves_p.collision_curves_batch_m data/batch_manifest.json --output-dir batch_output
+
+the manifest lists the variants, each with its envelopes and the drawer parameters of its machine:
+    { "output_dir": "batch_output",
+      "variants": [ { "name": "noah_rt",
+                      "p1_envelope": "noah_rt_collision_envelope_p1.csv", "p2_envelope": "noah_rt_collision_envelope_p2.csv",
+                      "p1_pos": 0, "p2_pos": 100, "p3_pos": 150, "bore_down_limit": 400, "iso_center": 300,
+                      "has_motorized_sub_pallet": true, "curve_size": 10,
+                      "optimize": true, "window_angles": [0, 50, 100, 150, 200], "optimize_angle_range": [0, 200] } ] }
+paths are relative to the manifest. "optimize" searches the motion window over every pair of window_angles (every grid
+angle >= 0 by default), scored over optimize_angle_range (by default the span of window_angles, the only angles a window
+changes). every envelope file is read once and shared with the workers through shared memory,
+each variant writes its gantry windows, its collision sweep and its frames, the batch writes summary.csv
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+from multiprocessing import shared_memory
+import os
+import time
+import traceback
+import numpy as np
+import pandas as pd
+import collision_curves_p.collision_curves_drawer_m as ccd
+import collision_curves_p.collision_curves_generator_m as ccg
+import collision_curves_p.collision_curves_loader_m as ccl
+import collision_curves_p.collision_curves_optimizer_m as cco
+
+
+# envelope path -> (rows, 3) array of the worker process, filled by attach_shared_envelopes
+worker_envelopes = {}
+# keeps the shared memory of the worker attached as long as the arrays above are in use
+worker_shared_memory = []
+
+# optional keys of a variant and their defaults
+VARIANT_DEFAULTS = { 'has_motorized_sub_pallet': True,
+                     'curve_size': ccd.collision_curves_drawer.m_default_curve_size,
+                     'motion_window_of_angle': [10, 60],
+                     'motion_profile': 'linear',
+                     'sub_pallet_settings': None,
+                     'set_sub_pallet_pos': 15,
+                     'angle_step': 10,
+                     'vertical_step': 10,
+                     'frame_angles': [-300, -150, 0, 150, 300],
+                     'frame_vertical': ccd.collision_curves_drawer.m_default_vertical,
+                     'optimize': False,
+                     'window_angles': None,
+                     'optimize_angle_range': None }
+
+
+def attach_shared_envelopes(shared_memory_name, layout):
+    """
+    worker initializer, maps the envelopes of the shared block without copying them.
+    layout: envelope path -> (first row, rows) in the block
+    """
+    block = shared_memory.SharedMemory(name=shared_memory_name)
+    worker_shared_memory.append(block)
+    total_rows = sum(rows for [_, rows] in layout.values())
+    envelopes = np.ndarray((total_rows, len(ccl.ENVELOPE_COLUMNS)), dtype=np.float64, buffer=block.buf)
+    for [path, [first_row, rows]] in layout.items():
+        worker_envelopes[path] = envelopes[first_row:first_row + rows]
+
+
+def run_variant(variant, output_dir):
+    """
+    runs the analyses of one variant on its shared envelopes, returns its row of the summary
+    """
+    start = time.perf_counter()
+    name = variant['name']
+    summary = { 'Variant': name }
+    try:
+        generator = ccg.collision_curves_generator(worker_envelopes[variant['p1_envelope']], worker_envelopes[variant['p2_envelope']])
+        drawer = ccd.collision_curves_drawer(variant['p1_pos'], variant['p2_pos'], variant['p3_pos'], variant['bore_down_limit'],
+                                             variant['iso_center'], generator, variant['has_motorized_sub_pallet'])
+        curve_size = variant['curve_size']
+        bore_down_limit = variant['bore_down_limit']
+        motion_window_of_angle = tuple(variant['motion_window_of_angle'])
+        sub_pallet_settings = variant['sub_pallet_settings']
+        if sub_pallet_settings is None:
+            sub_pallet_settings = 'Auto' if variant['has_motorized_sub_pallet'] else 'P1'
+        summary['Curve Size'] = curve_size
+        summary['Sub Pallet'] = sub_pallet_settings
+
+        # "vertical -> allowed tilt window" of every curve
+        gantry_windows = generator.build_gantry_windows(curve_size, bore_down_limit)
+        # build_gantry_windows leaves the current family of the generator alone
+        index = generator.calculate_collision_curves(curve_size)[1]
+        curve_names = index.m_curve_names
+        pd.concat([pd.DataFrame({ 'Curve': curve_names[curve_index],
+                                'Vertical': gantry_windows[curve_index, :, 0],
+                                'Valid': gantry_windows[curve_index, :, 1].astype(bool),
+                                'X1': gantry_windows[curve_index, :, 2],
+                                'X2': gantry_windows[curve_index, :, 3] }) for curve_index in range(len(curve_names))]
+                  ).to_csv(os.path.join(output_dir, f'{name}_gantry_windows.csv'), index=False)
+
+        # every (angle, vertical) of the tilt range and of the vertical box of run()
+        angles = index.m_angles[::variant['angle_step']]
+        verticals = np.arange(0, 561, variant['vertical_step'], dtype=float)
+        [angle, vertical] = [grid.ravel() for grid in np.meshgrid(angles, verticals)]
+        sweep = drawer.check_collisions(angle, vertical, variant['set_sub_pallet_pos'], sub_pallet_settings, motion_window_of_angle,
+                                        bore_down_limit, curve_size, 'Discrete', variant['motion_profile'])
+        sweep.to_csv(os.path.join(output_dir, f'{name}_sweep.csv'), index=False)
+        summary['Samples'] = len(sweep)
+        summary['Collisions'] = int(sweep['Collision'].sum())
+        summary['Collision Ratio'] = summary['Collisions'] / len(sweep)
+        summary['Min Upper Margin'] = sweep['Upper Margin'].min()
+        summary['Min Down Margin'] = sweep['Down Margin'].min()
+
+        if variant['optimize'] and variant['has_motorized_sub_pallet']:
+            optimizer = cco.collision_curves_window_optimizer(drawer, curve_size, bore_down_limit)
+            best = optimizer.optimize('range', motion_profiles=tuple(drawer.m_motion_profiles), window_angles=variant['window_angles'],
+                                      angle_range=variant['optimize_angle_range'], top=1, processes=1)
+            # the configured window scored over the same tilt range as the search
+            angle_range = optimizer.m_angle_range
+            summary['Optimize Range'] = f'({angle_range[0]:.0f}, {angle_range[1]:.0f})'
+            summary['Range @ Window'] = optimizer.evaluate_window(motion_window_of_angle, 'range', motion_profile=variant['motion_profile'],
+                                                                  angle_range=angle_range)
+            summary['Best Window'] = f"({best['Retraction'].iat[0]:.0f}, {best['Extension'].iat[0]:.0f}) {best['Profile'].iat[0]}"
+            summary['Best Range'] = best['Score'].iat[0]
+            summary['Best Mean Range'] = best['Mean'].iat[0]
+            # more than one means Best Window is only the first of the equally good windows
+            summary['Best Ties'] = optimizer.m_best_ties
+
+        for frame_angle in variant['frame_angles']:
+            png = drawer.render_frame_png(False, curve_size, motion_window_of_angle, bore_down_limit, sub_pallet_settings,
+                                          variant['set_sub_pallet_pos'], frame_angle, variant['frame_vertical'], 'Discrete', variant['motion_profile'])
+            with open(os.path.join(output_dir, f'{name}_angle_{frame_angle}.png'), 'wb') as file:
+                file.write(png)
+        summary['Error'] = ''
+    except Exception as error:
+        # one broken variant must not stop the nightly run of the others
+        summary['Error'] = f'{type(error).__name__}: {error}'
+        traceback.print_exc()
+    summary['Seconds'] = time.perf_counter() - start
+    return summary
+
+
+def read_manifest(manifest_file):
+    """
+    variants with their defaults filled in and their envelope paths resolved against the manifest
+    """
+    with open(manifest_file, encoding='utf-8-sig') as file:
+        manifest = json.load(file)
+    base_dir = os.path.dirname(os.path.abspath(manifest_file))
+    variants = []
+    for variant in manifest['variants']:
+        missing = [key for key in ['name', 'p1_envelope', 'p2_envelope', 'p1_pos', 'p2_pos', 'p3_pos', 'bore_down_limit', 'iso_center'] if key not in variant]
+        if len(missing) > 0:
+            raise ValueError(f"variant {variant.get('name', len(variants))}: missing {missing}")
+        variant = { **VARIANT_DEFAULTS, **variant }
+        for key in ['p1_envelope', 'p2_envelope']:
+            variant[key] = os.path.normpath(os.path.join(base_dir, variant[key]))
+        variants.append(variant)
+    names = [variant['name'] for variant in variants]
+    if len(set(names)) != len(names):
+        raise ValueError('variant names must be unique, they name the output files')
+    return manifest, variants
+
+
+def run_batch(manifest_file, output_dir=None, processes=None):
+    """
+    processes=None uses every core, processes=1 runs the variants in this process
+    """
+    [manifest, variants] = read_manifest(manifest_file)
+    if output_dir is None:
+        output_dir = os.path.join(os.path.dirname(os.path.abspath(manifest_file)), manifest.get('output_dir', 'batch_output'))
+    os.makedirs(output_dir, exist_ok=True)
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    # every envelope file once, however many variants use it
+    paths = list(dict.fromkeys(path for variant in variants for path in [variant['p1_envelope'], variant['p2_envelope']]))
+    envelopes = [ccl.load_collision_envelope(path) for path in paths]
+
+    if processes == 1:
+        worker_envelopes.update(zip(paths, envelopes))
+        try:
+            rows = [run_variant(variant, output_dir) for variant in variants]
+        finally:
+            worker_envelopes.clear()
+    else:
+        layout = {}
+        first_row = 0
+        for [path, envelope] in zip(paths, envelopes):
+            layout[path] = (first_row, len(envelope))
+            first_row += len(envelope)
+        block = shared_memory.SharedMemory(create=True, size=max(first_row * len(ccl.ENVELOPE_COLUMNS) * 8, 1))
+        try:
+            shared = np.ndarray((first_row, len(ccl.ENVELOPE_COLUMNS)), dtype=np.float64, buffer=block.buf)
+            for [path, envelope] in zip(paths, envelopes):
+                shared[layout[path][0]:layout[path][0] + layout[path][1]] = envelope
+            del shared
+            with ProcessPoolExecutor(max_workers=min(processes, len(variants)), initializer=attach_shared_envelopes,
+                                     initargs=(block.name, layout)) as executor:
+                rows = list(executor.map(run_variant, variants, [output_dir] * len(variants)))
+        finally:
+            block.close()
+            block.unlink()
+
+    summary = pd.DataFrame(rows)
+    summary.to_csv(os.path.join(output_dir, 'summary.csv'), index=False)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('manifest', help='json manifest of the variants')
+    parser.add_argument('--output-dir', help="overrides the manifest's output_dir")
+    parser.add_argument('--processes', type=int, help='worker processes, every core by default')
+    args = parser.parse_args()
+
+    summary = run_batch(args.manifest, args.output_dir, args.processes)
+    print(summary.to_string(index=False))
+    if (summary['Error'] != '').any():
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
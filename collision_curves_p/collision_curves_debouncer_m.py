@@ -0,0 +1,60 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import traceback
+
+
+class collision_curves_debouncer():
+    """
+    coalesces bursts of widget changes: only the latest submitted state is computed, the computation
+    runs on a worker thread and frames which got stale while computing are dropped instead of rendered
+    """
+    def __init__(self, compute, render, delay=0.1, on_error=None):
+        self.m_compute         = compute # state -> frame, runs on the worker thread
+        self.m_render          = render  # frame -> None, runs on the event loop thread
+        self.m_delay           = delay
+        self.m_on_error        = on_error
+        self.m_latest_state    = None
+        self.m_generation      = 0
+        self.m_task            = None
+        self.m_executor        = ThreadPoolExecutor(max_workers=1)
+        self.m_rendered_frames = 0
+        self.m_dropped_frames  = 0
+
+    def submit(self, state):
+        self.m_latest_state = state
+        self.m_generation += 1
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # no event loop, e.g. a plain python console, fall back to a synchronous update
+            self.m_render(self.m_compute(state))
+            self.m_rendered_frames += 1
+            return
+        if self.m_task is None or self.m_task.done():
+            self.m_task = asyncio.ensure_future(self.process())
+
+    async def process(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # let the rest of the burst arrive first
+            await asyncio.sleep(self.m_delay)
+            generation = self.m_generation
+            try:
+                frame = await loop.run_in_executor(self.m_executor, self.m_compute, self.m_latest_state)
+                if generation == self.m_generation:
+                    self.m_render(frame)
+                    self.m_rendered_frames += 1
+                    return
+            except Exception:
+                if self.m_on_error is None:
+                    raise
+                self.m_on_error(traceback.format_exc())
+                if generation == self.m_generation:
+                    return
+            # a newer state arrived while computing, skip this frame and compute the latest one
+            self.m_dropped_frames += 1
+
+    def close(self):
+        if self.m_task is not None:
+            self.m_task.cancel()
+        self.m_executor.shutdown(wait=False)
@@ -1,9 +1,10 @@
-import ipywidgets as widgets
-from ipywidgets import interact, interact_manual
 import numpy as np
 import pandas as pd
-import pylab as pl
 import collision_curves_p.collision_curves_generator_m as ccg
+import collision_curves_p.collision_curves_index_m as cci
+import collision_curves_p.collision_curves_renderer_m as ccr
+import collision_curves_p.collision_curves_debouncer_m as ccd
+import collision_curves_p.collision_curves_profiler_m as ccp
 
 
 class collision_curves_drawer():
@@ -18,98 +19,19 @@ class collision_curves_drawer():
         self.m_has_motorized_sub_pallet      = has_motorized_sub_pallet
 
     m_colormap                      = ['green', 'blue', 'orange', 'cyan', 'olive', 'purple', 'brown']
+    # share of the way from P1 to P2 the 'Auto' sub-pallet has moved, over the share of the motion window passed
+    m_motion_profiles               = { 'linear': lambda t: t,
+                                        'smoothstep': lambda t: t * t * (3 - 2 * t),
+                                        'cosine': lambda t: (1 - np.cos(np.pi * t)) / 2 }
     m_last_sp_encoder_pos           = 0
+    m_renderer                      = None
+    m_headless_renderer             = None
+    m_debouncer                     = None
      # default values, feel free to change
     m_default_vertical              = 400
     m_default_curve_size            = 2
     m_default_angle                 = 10
 
-    def draw_curve(self, df, color, alpha=1.0):
-        pl.plot(df['Angle'], df['Down'], label=f'{df.name} down', color=color, alpha=alpha) # x=angle, y=down
-        pl.plot(df['Angle'], df['Upper'], label=f'{df.name} upper', color=color, alpha=alpha) # x=angle, y=upper
-        pl.xticks(np.arange(-300, 300, 50)) 
-        pl.yticks(np.arange(-25, 450, 25))
-        pl.xlabel('Angle(1/10 Degrees)')
-        pl.ylabel('Vertical(mm)')
-        pl.ylim(450, -25)
-        pl.grid(True)
-        pl.legend(loc='lower left')
-        
-    def mark_point(self, x, y, color='red', marker='.', markerfacecolor='none', offset=[0, 0], description=''):
-        pl.plot(x, y, color=color, marker=marker, markerfacecolor=markerfacecolor)
-        pl.text(x + offset[0], y + offset[1], f'({x:.0f}, {y:.1f}) {description}', color=color)
-        
-    def mark_point_at_angle(self, df, angle, color='red', alpha=1.0, marker='.', markerfacecolor='none', offset=[0, 0], description=''):
-        y = df.loc[df['Angle'] >= angle][0:1]['Down'].iat[0]
-        x = angle
-        pl.plot(x, y, color=color, alpha=alpha, marker=marker, markerfacecolor=markerfacecolor)
-        pl.text(x + offset[0], y + offset[1], f'({x:.0f}, {y:.0f}){description}', color=color, alpha=alpha)
-        return [x, y]
-
-    def pickUpContinuous(self, series, key_value, interval):    
-        last_value = series.iat[0] - interval
-        start = series.first_valid_index()
-        end = series.last_valid_index()
-
-        found = False
-        for index, value in series.items():
-            if value == key_value:
-                found = True
-            if abs(value - last_value) != interval:
-                if found == True:
-                    break
-                start = index
-            last_value = value
-            end = index
-        
-        return series.loc[start:end]
-
-    def mark_point_at_vertical(self, df, vertical, color='red', alpha=1.0, marker='.', markerfacecolor='none', offset=[0, 0], description=''):
-        [valid, x1, x2, y] = self.get_point_at_vertical(df, vertical)
-            
-        if valid == True:
-            pl.plot(x1, y, color=color, alpha=alpha, marker=marker, markerfacecolor=markerfacecolor)
-            pl.text(x1 + offset[0], y + offset[1], f'({x1:.0f}, {y:.0f}){description}', color=color, alpha=alpha)
-
-            pl.plot(x2, y, color=color, alpha=alpha, marker=marker, markerfacecolor=markerfacecolor)
-            pl.text(x2 + offset[0], y + offset[1], f'({x2:.0f}, {y:.0f}){description}', color=color, alpha=alpha)
-
-        return [valid, x1, x2, y]
-
-    def get_point_at_vertical(self, df, vertical):
-        segment_down = df.loc[df['Down'] >= vertical]
-        segment_upper = df.loc[df['Upper'] <= vertical]
-
-        if len(segment_down) > 0 and len(segment_upper) > 0:
-            continuous_segment_down = self.pickUpContinuous(segment_down['Angle'], 0.0, 1.0)
-            continuous_segment_upper = self.pickUpContinuous(segment_upper['Angle'], 0.0, 1.0)
-            
-            x1 = max(continuous_segment_down.iat[0], continuous_segment_upper.iat[0])
-            x2 = min(continuous_segment_down.iat[-1], continuous_segment_upper.iat[-1])
-            
-            y = vertical
-            
-            return [True, x1, x2, y]
-
-        return [False, 0, 0, 0]
-
-    def mark_point_at_positive_angle_and_at_down(self, df, down, color='red', marker='.', markerfacecolor='none', offset=[0, 0], description=''):
-        y= df.loc[df['Angle'] >= 0].loc[df['Down'] >= down][0:1]['Down'].iat[0]
-        x = df.loc[df['Angle'] >= 0].loc[df['Down'] >= down][0:1]['Angle'].iat[0]
-        pl.plot(x, y,  color=color, marker=marker, markerfacecolor=markerfacecolor)
-        pl.text(x + offset[0], y + offset[1], f'({x:.0f}, {y:.0f}){description}', color=color)
-        return [x, y]
-
-    def draw_vertical_line(self, x, ymin, ymax, color, alpha, linestyle, text='', textx='', texty=''):
-        pl.vlines(x=x, ymin=ymin, ymax=ymax, color=color, alpha=alpha, linestyle=linestyle)
-        if len(text) > 0:
-            pl.text(textx, texty, text, color=color, alpha=alpha)
-        
-    def draw_horizontal_line(self, y, xmin, xmax, color, alpha, linestyle, text='', textx='', texty=''):
-        pl.hlines(y=y, xmin=xmin, xmax=xmax, color=color, alpha=alpha, linestyle=linestyle)
-        if len(text) > 0:
-            pl.text(textx, texty, text, color=color, alpha=alpha)
-
     def is_in_notebook(self):
         import sys
         return 'ipykernel' in sys.modules
@@ -124,25 +46,32 @@ class collision_curves_drawer():
             from IPython.display import clear_output as clear
             clear()
         
-    def printCouchCurve(self, curve_name):
+    def printCouchCurve(self, curve_name, curve_size=None):
+        # curve_size: the family of the frame on screen, by default the current one
         if curve_name == 'None':
             self.clear_output()
             return
-        for curve in self.m_generator.m_interpolated_collision_curves:
-            if curve.name == curve_name:
-                print(f'{curve_name}')
-                print(curve.to_string())
-
-    def printGantryCurve(self, curve_name):
+        if curve_size is None:
+            curve_size = len(self.m_generator.m_interpolated_collision_curves)
+        [curves, index, _] = self.m_generator.calculate_collision_curves(curve_size)
+        curve_names = index.m_curve_names
+        if curve_name in curve_names:
+            print(f'{curve_name}')
+            print(curves[curve_names.index(curve_name)].to_string())
+
+    def printGantryCurve(self, curve_name, curve_size=None):
         if curve_name == 'None':
             self.clear_output()
             return
-        for curve in self.m_generator.m_interpolated_collision_curves:
-            if curve.name == curve_name:
-                print(f'{curve_name}')
-                for vertical_encoder_pos in range(90, int(self.m_bore_down_limit)+1): # the range was got from the min height to max height from the collision upper and lower curves.
-                    v = self.get_point_at_vertical(curve, vertical_encoder_pos+0.7)
-                    print(f'{v[1]}, {v[2]}, {v[3]}')
+        if curve_size is None:
+            curve_size = len(self.m_generator.m_interpolated_collision_curves)
+        curve_names = self.m_generator.calculate_collision_curves(curve_size)[1].m_curve_names
+        if curve_name in curve_names:
+            print(f'{curve_name}')
+            # the range was got from the min height to max height from the collision upper and lower curves.
+            gantry_windows = self.m_generator.build_gantry_windows(len(curve_names), self.m_bore_down_limit, first_vertical=90, vertical_offset=0.7)
+            for [vertical, valid, x1, x2] in gantry_windows[curve_names.index(curve_name)]:
+                print(f'{x1}, {x2}, {vertical}' if valid else '0, 0, 0')
             
 
     def convert_sp_relative_pos_to_encoder_pos(self, sp_relative_pos):
@@ -160,27 +89,20 @@ class collision_curves_drawer():
     def convert_vertical_display_pos_to_encoder_pos(self, vertical_display_pos):
         return 650.7-vertical_display_pos
 
-    def set_current_angle_and_draw_all(self, debug_mode, curve_size, motion_window_of_angle, 
-                                    bore_down_limit, sub_pallet_settings, 
-                                    set_sub_pallet_pos, angle, vertical_display_pos):
-
+    def calculate_sp_relative_pos(self, sub_pallet_settings, set_sub_pallet_pos, angle, motion_window_of_angle, motion_profile='linear'):
+        # works on scalars as well as on whole arrays of samples, and of motion windows
         retraction_angle = motion_window_of_angle[0]
         extension_angle = motion_window_of_angle[1]
 
-        self.m_generator.build_collision_curves(curve_size)
-        
-        # draw-1 horizontal lines
-        self.draw_horizontal_line(bore_down_limit, -300, 300, 'purple', 1.0, '--', text=f'bore down limit({bore_down_limit} mm)', textx=80, texty=bore_down_limit+15)
-        self.draw_horizontal_line(self.m_iso_center, -300, 300,  'purple', 1.0, '--', text =f'ISO center({self.m_iso_center} mm)', textx=-290, texty=self.m_iso_center-8)
-        
         sp_relative_pos = self.m_p1_p2_dis
         if sub_pallet_settings == 'Auto':
-            if angle >= extension_angle:
-                sp_relative_pos = 0
-            elif angle >= retraction_angle:
-                sp_relative_pos = self.m_p1_p2_dis - (self.m_p1_p2_dis * (angle - retraction_angle) / (extension_angle - retraction_angle))
-            else:
-                sp_relative_pos = self.m_p1_p2_dis
+            angle = np.asarray(angle, dtype=float)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                if motion_profile == 'linear':
+                    ramp = self.m_p1_p2_dis - (self.m_p1_p2_dis * (angle - retraction_angle) / (extension_angle - retraction_angle))
+                else:
+                    ramp = self.m_p1_p2_dis - self.m_p1_p2_dis * self.m_motion_profiles[motion_profile]((angle - retraction_angle) / (extension_angle - retraction_angle))
+            sp_relative_pos = np.where(angle >= extension_angle, 0, np.where(angle >= retraction_angle, ramp, self.m_p1_p2_dis))[()]
         elif sub_pallet_settings == 'Encoder':
             sp_relative_pos = self.convert_sp_encoder_pos_to_relative_pos(set_sub_pallet_pos)
         elif sub_pallet_settings == 'System':
@@ -191,95 +113,289 @@ class collision_curves_drawer():
             sp_relative_pos = 0
         elif sub_pallet_settings == 'P3':
             sp_relative_pos = 0-(self.m_p3_pos - self.m_p2_pos)
+        return sp_relative_pos
+
+    def calculate_high_light_index(self, sp_relative_pos, curve_size=None):
+        # snap the sub-pallet position to one of the curves of the current family
+        tolerance = -0.65
+        if curve_size is None:
+            curve_size = len(self.m_generator.m_interpolated_collision_curves)
+        step = self.m_p1_p2_dis / (curve_size - 1) 
+        if isinstance(sp_relative_pos, (int, float)):
+            return int((self.m_p1_p2_dis - (sp_relative_pos + tolerance)) / step)
+        high_light_index = (self.m_p1_p2_dis - (np.asarray(sp_relative_pos) + tolerance)) / step
+        if high_light_index.ndim == 0:
+            return int(high_light_index)
+        return np.trunc(high_light_index).astype(int)
+
+    def get_limits_at_angle(self, high_light_index, angle):
+        index = self.m_generator.m_collision_curves_index
+        if np.ndim(high_light_index) == 0:
+            if 0 <= high_light_index < len(index):
+                return index.limits_at(high_light_index, angle)
+            # no curve is highlighted outside of the family
+            return 0, 0
+
+        highlighted = (high_light_index >= 0) & (high_light_index < len(index))
+        limits = index.m_limits[np.clip(high_light_index, 0, len(index) - 1), index.angle_to_position(angle)]
+        limits = np.where(highlighted[..., np.newaxis], limits, 0)
+        return limits[..., 0], limits[..., 1]
+
+    def is_within_p1_p2(self, sp_relative_pos):
+        # 0.65 mm past P1 and P2 at most. stricter than the discrete snapping, whose truncation keeps
+        # the P1 curve up to 0.65 mm + one step past P1 and the P2 curve up to one step past P2
+        tolerance = 0.65
+        return (sp_relative_pos >= -tolerance) & (sp_relative_pos <= self.m_p1_p2_dis + tolerance)
+
+    def get_continuous_limits_at_angle(self, sp_relative_pos, angle):
+        # interpolated straight from the envelopes, no curve outside of P1..P2
+        sp_relative_pos = np.asarray(sp_relative_pos, dtype=float)
+        sp_fraction = np.clip((self.m_p1_p2_dis - sp_relative_pos) / self.m_p1_p2_dis, 0, 1)
+        [upper, down] = self.m_generator.evaluate_limits(sp_fraction, angle)
+        inside = self.is_within_p1_p2(sp_relative_pos)
+        if np.ndim(upper) == 0:
+            return (upper, down) if inside else (0, 0)
+        return np.where(inside, upper, 0), np.where(inside, down, 0)
+
+    @ccp.profiler.timed('drawer.check_collisions')
+    def check_collisions(self, angle, vertical_display_pos, set_sub_pallet_pos=0, sub_pallet_settings='Encoder',
+                        motion_window_of_angle=(10, 60), bore_down_limit=None, curve_size=None, evaluation_mode='Discrete', motion_profile='linear'):
+        """
+        headless collision check of whole trajectories, one row per (angle, vertical, sub-pallet) sample.
+        set_sub_pallet_pos is interpreted according to sub_pallet_settings, like the 'SP Pos' box of run(),
+        the margins are positive while the sample stays inside the limits. In the 'Continuous' evaluation
+        mode the limits come straight from the envelopes and 'Curve' is -1, a sub-pallet more than 0.65 mm past P1 or P2
+        has no limits there while the 'Discrete' mode still snaps it to the end curve for about one more step
+        """
+        if bore_down_limit is None:
+            bore_down_limit = self.m_bore_down_limit
+        if curve_size is None:
+            curve_size = self.m_default_curve_size
+
+        angle = np.asarray(angle, dtype=float)
+        vertical_encoder_pos = self.convert_vertical_display_pos_to_encoder_pos(np.asarray(vertical_display_pos, dtype=float))
+        sp_relative_pos = self.calculate_sp_relative_pos(sub_pallet_settings, np.asarray(set_sub_pallet_pos, dtype=float), angle, motion_window_of_angle, motion_profile)
+        [angle, vertical_encoder_pos, sp_relative_pos] = np.broadcast_arrays(angle, vertical_encoder_pos, sp_relative_pos)
+        angle = np.atleast_1d(angle)
+        vertical_encoder_pos = np.atleast_1d(vertical_encoder_pos)
+
+        if evaluation_mode == 'Continuous':
+            high_light_index = np.full(len(angle), -1)
+            [current_up_limit, current_down_limit] = self.get_continuous_limits_at_angle(np.atleast_1d(sp_relative_pos), angle)
+        else:
+            with self.m_generator.m_lock:
+                self.m_generator.build_collision_curves(curve_size)
+                high_light_index = np.atleast_1d(self.calculate_high_light_index(np.atleast_1d(sp_relative_pos)))
+                [current_up_limit, current_down_limit] = self.get_limits_at_angle(high_light_index, angle)
+        current_down_limit = np.minimum(current_down_limit, bore_down_limit)
+
+        upper_margin = vertical_encoder_pos - current_up_limit
+        down_margin = current_down_limit - vertical_encoder_pos
+        return pd.DataFrame({ 'Angle': angle,
+                            'Vertical': vertical_encoder_pos,
+                            'Curve': high_light_index,
+                            'Upper Margin': upper_margin,
+                            'Down Margin': down_margin,
+                            'Collision': (down_margin < 0) | (upper_margin < 0) })
+
+    def is_colliding(self, angle, vertical_encoder_pos, sp_relative_pos, bore_down_limit, curve_size=None):
+        if curve_size is None:
+            curve_size = self.m_default_curve_size
+        index = self.m_generator.calculate_collision_curves(curve_size)[1]
+        high_light_index = self.calculate_high_light_index(sp_relative_pos, curve_size)
+        # no curve is highlighted outside of the family
+        [current_up_limit, current_down_limit] = index.limits_at(high_light_index, angle) if 0 <= high_light_index < len(index) else [0, 0]
+        current_down_limit = min(current_down_limit, bore_down_limit)
+        return vertical_encoder_pos > current_down_limit or vertical_encoder_pos < current_up_limit
+
+    def build_sub_pallet_pos_str(self, sp_encoder_pos):
+        icon = ['[', ']']
+        sub_pallet_pos_str = ""
+        if self.m_last_sp_encoder_pos < sp_encoder_pos:
+            icon[0] = '<'
+        elif self.m_last_sp_encoder_pos > sp_encoder_pos:
+            icon[1] = '>'
+        if sp_encoder_pos > self.m_p3_pos:
+            sub_pallet_pos_str = f'|-{icon[0]}{icon[1]}- P3={self.m_p3_pos} ---------- P2={self.m_p2_pos} ------------------ P1={self.m_p1_pos} ----|'
+        elif self.m_p3_pos == sp_encoder_pos:
+            sub_pallet_pos_str = f'|----{icon[0]}P3={self.m_p3_pos}{icon[1]}---------- P2={self.m_p2_pos} ------------------ P1={self.m_p1_pos} ----|'
+        elif self.m_p3_pos > sp_encoder_pos and sp_encoder_pos > self.m_p2_pos:
+            sub_pallet_pos_str = f'|---- P3={self.m_p3_pos} ----{icon[0]}{icon[1]}---- P2={self.m_p2_pos} ------------------ P1={self.m_p1_pos} ----|'
+        elif self.m_p2_pos == sp_encoder_pos:
+            sub_pallet_pos_str = f'|---- P3={self.m_p3_pos} ----------{icon[0]}P2={self.m_p2_pos}{icon[1]}------------------ P1={self.m_p1_pos} ----|'
+        elif self.m_p2_pos > sp_encoder_pos and sp_encoder_pos > self.m_p1_pos:
+            sub_pallet_pos_str = f'|---- P3={self.m_p3_pos} ---------- P2={self.m_p2_pos} --------{icon[0]}{icon[1]}-------- P1={self.m_p1_pos} ----|'
+        elif self.m_p1_pos == sp_encoder_pos:
+            sub_pallet_pos_str = f'|---- P3={self.m_p3_pos} ---------- P2={self.m_p2_pos} ------------------{icon[0]}P1={self.m_p1_pos}{icon[1]}----|'
+        else:
+            sub_pallet_pos_str = f'|---- P3={self.m_p3_pos} ---------- P2={self.m_p2_pos} ------------------ P1={self.m_p1_pos} -{icon[0]}{icon[1]}-|'
+        
+        return f'SP Axis: |Out{sub_pallet_pos_str}In|        |Gantry|'
+
+    @ccp.profiler.timed('drawer.calculate_frame')
+    def calculate_frame(self, debug_mode, curve_size, motion_window_of_angle, 
+                        bore_down_limit, sub_pallet_settings, 
+                        set_sub_pallet_pos, angle, vertical_display_pos, evaluation_mode='Discrete', motion_profile='linear'):
+        """
+        everything one frame of set_current_angle_and_draw_all shows, without drawing anything.
+        evaluation_mode='Continuous' draws only the curve at the current sub-pallet position instead of the family,
+        and no curve once the sub-pallet is more than 0.65 mm past P1 or P2
+        """
+        retraction_angle = motion_window_of_angle[0]
+        extension_angle = motion_window_of_angle[1]
+
+        sp_relative_pos = self.calculate_sp_relative_pos(sub_pallet_settings, set_sub_pallet_pos, angle, motion_window_of_angle, motion_profile)
         
-        current_up_limit = 0
-        current_down_limit = 0
         vertical_encoder_pos = self.convert_vertical_display_pos_to_encoder_pos(vertical_display_pos)
-        # draw-2: collision curves
+        # collision curves
+        curves = []
+        marks = []
         curve_names = ['None']
-        tolerance = -0.65
-        curve_size = len(self.m_generator.m_interpolated_collision_curves)
-        step = self.m_p1_p2_dis / (curve_size - 1) 
-        high_light_index =  int((self.m_p1_p2_dis - (sp_relative_pos + tolerance)) / step)
-        for index in range(len(self.m_generator.m_interpolated_collision_curves)):
-            df = self.m_generator.m_interpolated_collision_curves[index]
-            curve_names.append(df.name)
-            if index == high_light_index:
-                current_down_limit = df.loc[df['Angle'] >= angle]['Down'].iat[0]
-                current_up_limit = df.loc[df['Angle'] >= angle]['Upper'].iat[0]
-                self.draw_curve(df, self.m_colormap[index % len(self.m_colormap)], 1.0)
-                if debug_mode is True:
-                    self.mark_point_at_vertical(df, vertical_encoder_pos, 'orange', 1.0, '.')
-                    self.mark_point_at_angle(df, retraction_angle,'orange', 1.0, '.', offset = [-35, -15])
-                    self.mark_point_at_angle(df, extension_angle, 'orange', 1.0, '.', offset = [10, -15])
-            else:
-                self.draw_curve(df, self.m_colormap[index % len(self.m_colormap)], 0.08)
+        highlighted_curve = None
+        if evaluation_mode == 'Continuous':
+            [current_up_limit, current_down_limit] = self.get_continuous_limits_at_angle(sp_relative_pos, angle)
+            # like the discrete mode outside of the family, nothing to draw
+            if self.is_within_p1_p2(sp_relative_pos):
+                p1_angles = self.m_generator.m_envelopes[0][0]
+                angles = np.arange(p1_angles[0], p1_angles[-1]+1)
+                [upper, down] = self.get_continuous_limits_at_angle(np.full(len(angles), sp_relative_pos), angles)
+                highlighted_curve = [angles, upper, down]
+                curves.append(['sp @ current', angles, upper, down, self.m_colormap[0], 1.0])
+        else:
+            # built and read in one go, the debug views of an asynchronous run may ask for another family meanwhile
+            with self.m_generator.m_lock:
+                self.m_generator.build_collision_curves(curve_size)
+                index = self.m_generator.m_collision_curves_index
+                curve_names += index.m_curve_names
+                high_light_index = self.calculate_high_light_index(sp_relative_pos)
+                [current_up_limit, current_down_limit] = self.get_limits_at_angle(high_light_index, angle)
+                for curve_index in range(len(index)):
+                    alpha = 1.0 if curve_index == high_light_index else 0.08
+                    curves.append([index.m_curve_names[curve_index], index.m_angles, index.m_limits[curve_index, :, 0], index.m_limits[curve_index, :, 1],
+                                   self.m_colormap[curve_index % len(self.m_colormap)], alpha])
+                if 0 <= high_light_index < len(index):
+                    highlighted_curve = [index.m_angles, index.m_limits[high_light_index, :, 0], index.m_limits[high_light_index, :, 1]]
+        if debug_mode is True and highlighted_curve is not None:
+            [angles, upper, down] = highlighted_curve
+            [valid, x1, x2] = cci.calculate_gantry_windows(angles, upper, down, [vertical_encoder_pos])
+            if valid[0]:
+                y = vertical_encoder_pos
+                marks.append([x1[0], y, 'orange', 1.0, [0, 0], f'({x1[0]:.0f}, {y:.0f})'])
+                marks.append([x2[0], y, 'orange', 1.0, [0, 0], f'({x2[0]:.0f}, {y:.0f})'])
+            for [x, offset] in [[retraction_angle, [-35, -15]], [extension_angle, [10, -15]]]:
+                # first grid angle >= x, like the lookups of the discrete mode
+                y = down[min(np.searchsorted(angles, x), len(angles)-1)]
+                marks.append([x, y, 'orange', 1.0, offset, f'({x:.0f}, {y:.0f})'])
         
-        # draw-3: circle of angle point
+        # circle of angle point
         current_down_limit = min(current_down_limit, bore_down_limit)
         
-        if vertical_encoder_pos > current_down_limit or vertical_encoder_pos < current_up_limit:
-            self.mark_point(angle, vertical_encoder_pos, color='red', marker='o', markerfacecolor='red', offset=[-50, 20], description=' collision!')
+        collision = vertical_encoder_pos > current_down_limit or vertical_encoder_pos < current_up_limit
+        if collision:
+            point = [angle, vertical_encoder_pos, 'red', 'red', [-50, 20], f'({angle:.0f}, {vertical_encoder_pos:.1f})  collision!']
         else:
-            self.mark_point(angle, vertical_encoder_pos, color='green', marker='o', markerfacecolor='none', offset=[-60, 20]) # description=f', down={current_down_limit:.0f}'
+            point = [angle, vertical_encoder_pos, 'green', 'none', [-60, 20], f'({angle:.0f}, {vertical_encoder_pos:.1f}) '] # description=f', down={current_down_limit:.0f}'
 
-        # draw-4: sp axis
+        # sp axis
+        sp_encoder_pos = self.convert_sp_relative_pos_to_encoder_pos(sp_relative_pos)
         if self.m_has_motorized_sub_pallet:
-            # motion window
-            self.draw_vertical_line(retraction_angle, 400, 120, 'blue', 0.75, '--', text ='motion window', textx = retraction_angle-150, texty = 200)
-            self.draw_vertical_line(extension_angle, 400, 120,  'blue', 0.75, '--')
-
-            sp_encoder_pos = self.convert_sp_relative_pos_to_encoder_pos(sp_relative_pos)
             sp_display_pos = self.convert_sp_encoder_pos_to_display_pos(sp_encoder_pos)
-            icon = ['[', ']']
-            sub_pallet_pos_str = ""
-            if self.m_last_sp_encoder_pos < sp_encoder_pos:
-                icon[0] = '<'
-            elif self.m_last_sp_encoder_pos > sp_encoder_pos:
-                icon[1] = '>'
-            if sp_encoder_pos > self.m_p3_pos:
-                sub_pallet_pos_str = f'|-{icon[0]}{icon[1]}- P3={self.m_p3_pos} ---------- P2={self.m_p2_pos} ------------------ P1={self.m_p1_pos} ----|'
-            elif self.m_p3_pos == sp_encoder_pos:
-                sub_pallet_pos_str = f'|----{icon[0]}P3={self.m_p3_pos}{icon[1]}---------- P2={self.m_p2_pos} ------------------ P1={self.m_p1_pos} ----|'
-            elif self.m_p3_pos > sp_encoder_pos and sp_encoder_pos > self.m_p2_pos:
-                sub_pallet_pos_str = f'|---- P3={self.m_p3_pos} ----{icon[0]}{icon[1]}---- P2={self.m_p2_pos} ------------------ P1={self.m_p1_pos} ----|'
-            elif self.m_p2_pos == sp_encoder_pos:
-                sub_pallet_pos_str = f'|---- P3={self.m_p3_pos} ----------{icon[0]}P2={self.m_p2_pos}{icon[1]}------------------ P1={self.m_p1_pos} ----|'
-            elif self.m_p2_pos > sp_encoder_pos and sp_encoder_pos > self.m_p1_pos:
-                sub_pallet_pos_str = f'|---- P3={self.m_p3_pos} ---------- P2={self.m_p2_pos} --------{icon[0]}{icon[1]}-------- P1={self.m_p1_pos} ----|'
-            elif self.m_p1_pos == sp_encoder_pos:
-                sub_pallet_pos_str = f'|---- P3={self.m_p3_pos} ---------- P2={self.m_p2_pos} ------------------{icon[0]}P1={self.m_p1_pos}{icon[1]}----|'
-            else:
-                sub_pallet_pos_str = f'|---- P3={self.m_p3_pos} ---------- P2={self.m_p2_pos} ------------------ P1={self.m_p1_pos} -{icon[0]}{icon[1]}-|'
-            
-            sub_pallet_pos_str = f'SP Axis: |Out{sub_pallet_pos_str}In|        |Gantry|'
-
-            pl.title(f'Collision Curves for SP @ Encoder={sp_encoder_pos:.0f}mm, System={sp_display_pos:.0f}mm', fontsize=10)
-            pl.show()
-            print(sub_pallet_pos_str)
-            self.m_last_sp_encoder_pos = sp_encoder_pos
+            title = f'Collision Curves for SP @ Encoder={sp_encoder_pos:.0f}mm, System={sp_display_pos:.0f}mm'
+            sub_pallet_pos_str = self.build_sub_pallet_pos_str(sp_encoder_pos)
         else:
-            pl.title(f'Collision Curves', fontsize=10)
-            pl.show()
+            title = f'Collision Curves'
+            sub_pallet_pos_str = None
+
+        return { 'curves': curves,
+                'curve_names': curve_names,
+                'bore_down_limit': bore_down_limit,
+                'iso_center': self.m_iso_center,
+                'motion_window_of_angle': motion_window_of_angle if self.m_has_motorized_sub_pallet else None,
+                'point': point,
+                'marks': marks,
+                'title': title,
+                'collision': collision,
+                'sp_encoder_pos': sp_encoder_pos,
+                'sub_pallet_pos_str': sub_pallet_pos_str,
+                'curve_size': curve_size,
+                'debug_mode': debug_mode }
+
+    def get_renderer(self, headless=False):
+        # one renderer per mode, created on first use and reused by every later frame
+        if headless:
+            if self.m_headless_renderer is None:
+                self.m_headless_renderer = ccr.collision_curves_renderer(headless=True)
+            return self.m_headless_renderer
+        if self.m_renderer is None:
+            self.m_renderer = ccr.collision_curves_renderer(headless=False)
+        return self.m_renderer
+
+    @ccp.profiler.timed('drawer.set_current_angle_and_draw_all')
+    def set_current_angle_and_draw_all(self, debug_mode, curve_size, motion_window_of_angle, 
+                                    bore_down_limit, sub_pallet_settings, 
+                                    set_sub_pallet_pos, angle, vertical_display_pos, evaluation_mode='Discrete', motion_profile='linear'):
 
-        if debug_mode is True:
-            interact(self.printCouchCurve, curve_name = widgets.Select(options=curve_names,
+        frame = self.calculate_frame(debug_mode, curve_size, motion_window_of_angle, 
+                                    bore_down_limit, sub_pallet_settings, 
+                                    set_sub_pallet_pos, angle, vertical_display_pos, evaluation_mode, motion_profile)
+        self.show_frame(frame)
+
+    @ccp.profiler.timed('drawer.show_frame')
+    def show_frame(self, frame):
+        renderer = self.get_renderer()
+        renderer.draw_frame(frame)
+        renderer.show()
+        if frame['sub_pallet_pos_str'] is not None:
+            print(frame['sub_pallet_pos_str'])
+            self.m_last_sp_encoder_pos = frame['sp_encoder_pos']
+
+        if frame['debug_mode'] is True:
+            import ipywidgets as widgets
+            from ipywidgets import interact, fixed
+            # bound to the family of this frame, not to whatever the generator holds when a curve is picked
+            interact(self.printCouchCurve, curve_name = widgets.Select(options=frame['curve_names'],
                                                 value='None', 
-                                                description='Couch Curve:'))
+                                                description='Couch Curve:'),
+                                           curve_size = fixed(frame['curve_size']))
 
-            interact(self.printGantryCurve, curve_name = widgets.Select(options=curve_names,
+            interact(self.printGantryCurve, curve_name = widgets.Select(options=frame['curve_names'],
                                                 value='None', 
-                                                description='Gantry Curve:'))
+                                                description='Gantry Curve:'),
+                                            curve_size = fixed(frame['curve_size']))
+
+    def render_frame_png(self, debug_mode=False, curve_size=None, motion_window_of_angle=(10, 60), 
+                        bore_down_limit=None, sub_pallet_settings='P1', 
+                        set_sub_pallet_pos=15, angle=None, vertical_display_pos=None, evaluation_mode='Discrete', motion_profile='linear'):
+        """
+        renders one frame on the headless Agg renderer and returns it as png bytes, no Jupyter needed
+        """
+        frame = self.calculate_frame(debug_mode,
+                                    self.m_default_curve_size if curve_size is None else curve_size,
+                                    motion_window_of_angle,
+                                    self.m_bore_down_limit if bore_down_limit is None else bore_down_limit,
+                                    sub_pallet_settings,
+                                    set_sub_pallet_pos,
+                                    self.m_default_angle if angle is None else angle,
+                                    self.m_default_vertical if vertical_display_pos is None else vertical_display_pos,
+                                    evaluation_mode,
+                                    motion_profile)
+        renderer = self.get_renderer(headless=True)
+        renderer.draw_frame(frame)
+        return renderer.to_png()
 
     def update_curve_at_p1(self, data, name='sp @ p1'):
-        self.g_collision_curve_sp_at_p1 = pd.DataFrame(columns=['Angle', 'Upper','Down'], data=data)
-        self.g_collision_curve_sp_at_p1.name = name
+        self.m_generator.update_curve_at_p1(data, name)
 
     def update_curve_at_p2(self, data, name='sp @ p2'):
-        self.g_collision_curve_sp_at_p2 = pd.DataFrame(columns=['Angle', 'Upper','Down'], data=data)
-        self.g_collision_curve_sp_at_p2.name = name
+        self.m_generator.update_curve_at_p2(data, name)
 
-    def run(self):
+    def run(self, asynchronous=False, debounce=0.1):
+        """
+        asynchronous=False redraws on every widget event through interact,
+        asynchronous=True coalesces the events of the last `debounce` seconds and computes the frames off the kernel thread
+        """
+        import ipywidgets as widgets
+        from ipywidgets import interact
         debug_mode_ui = widgets.Checkbox(value=False, description='Debug Mode:')
 
         curve_size_ui = widgets.IntSlider(min=2, max=10, step=1, value=self.m_default_curve_size, description="Curve-Size:", disabled=(self.m_has_motorized_sub_pallet == False))
@@ -303,7 +419,37 @@ class collision_curves_drawer():
             button_style='', # 'success', 'info', 'warning', 'danger' or ''
             tooltips=['Auto', 'Lock @P1', 'Lock @P2', 'Lock @P3', 'Manual Set Encoder', 'Manual Set System']
         )
+
+        evaluation_mode_ui = widgets.ToggleButtons(
+            options=['Discrete', 'Continuous'],
+            value='Discrete',
+            description='Evaluation:',
+            disabled=(self.m_has_motorized_sub_pallet == False),
+            tooltips=['Snap the sub pallet to one of the Curve-Size curves', 'Interpolate the limits at the exact sub pallet position']
+        )
+
+        motion_profile_ui = widgets.ToggleButtons(
+            options=list(self.m_motion_profiles),
+            value='linear',
+            description='M-Profile:',
+            disabled=(self.m_has_motorized_sub_pallet == False),
+            tooltips=['Constant speed over the motion window', 'Eased in and out', 'Half cosine, eased in and out']
+        )
                 
+        if asynchronous:
+            self.run_asynchronous(debounce,
+                debug_mode = debug_mode_ui,
+                curve_size = curve_size_ui,
+                motion_window_of_angle = motion_window_of_angle_ui,
+                bore_down_limit = bore_down_limit_ui,
+                sub_pallet_settings = sub_pallet_settings_ui,
+                set_sub_pallet_pos = set_sub_pallet_pos_ui,
+                angle = angle_slider_ui,
+                vertical_display_pos = vertical_ui,
+                evaluation_mode = evaluation_mode_ui,
+                motion_profile = motion_profile_ui)
+            return
+
         w = interact(self.set_current_angle_and_draw_all, 
             debug_mode = debug_mode_ui,
             curve_size = curve_size_ui,
@@ -312,4 +458,33 @@ class collision_curves_drawer():
             set_sub_pallet_pos = set_sub_pallet_pos_ui,
             angle = angle_slider_ui,
             vertical_display_pos = vertical_ui,
-            bore_down_limit = bore_down_limit_ui)
+            bore_down_limit = bore_down_limit_ui,
+            evaluation_mode = evaluation_mode_ui,
+            motion_profile = motion_profile_ui)
+
+    def run_asynchronous(self, debounce, **controls):
+        import ipywidgets as widgets
+        from IPython.display import display
+        output = widgets.Output()
+
+        def compute(state):
+            return self.calculate_frame(**state)
+
+        def render(frame):
+            with output:
+                output.clear_output(wait=True)
+                self.show_frame(frame)
+
+        def show_error(error):
+            with output:
+                print(error)
+
+        self.m_debouncer = ccd.collision_curves_debouncer(compute, render, debounce, on_error=show_error)
+
+        def on_change(change):
+            self.m_debouncer.submit({ name: ui.value for [name, ui] in controls.items() })
+
+        for ui in controls.values():
+            ui.observe(on_change, names='value')
+        display(widgets.VBox(list(controls.values()) + [output]))
+        on_change(None)
@@ -1,93 +1,204 @@
-from scipy import interpolate
+from collections import OrderedDict
+import hashlib
+import os
+import threading
 import numpy as np
 import pandas as pd
+import collision_curves_p.collision_curves_index_m as cci
+import collision_curves_p.collision_curves_interpolator_m as ccip
+import collision_curves_p.collision_curves_loader_m as ccl
+import collision_curves_p.collision_curves_profiler_m as ccp
 
 class collision_curves_generator():
+    # number of curve families kept by build_collision_curves, least recently used ones are evicted first
+    m_default_cache_size = 16
+    # bump when the layout of the persisted gantry window tables changes
+    m_gantry_windows_version = 2
 
-    def __init__(self, collision_curve_sp_at_p1_csv_file, collision_curve_sp_at_p2_csv_file):
-        self.m_collision_curve_sp_at_p1      = pd.read_csv(collision_curve_sp_at_p1_csv_file) # 'data/p1.csv'
+    def __init__(self, collision_curve_sp_at_p1_csv_file, collision_curve_sp_at_p2_csv_file, cache_size=m_default_cache_size, cache_dir=None):
+        # 'data/p1.csv' and 'data/p2.csv', their binary .npy from ccl.convert_collision_envelope, or (rows, 3) arrays
+        sp_at_p1 = ccl.load_collision_envelope(collision_curve_sp_at_p1_csv_file, validate=False)
+        sp_at_p2 = ccl.load_collision_envelope(collision_curve_sp_at_p2_csv_file, validate=False)
+        ccl.validate_collision_envelopes(sp_at_p1, sp_at_p2)
+        self.m_collision_curve_sp_at_p1      = pd.DataFrame(columns=ccl.ENVELOPE_COLUMNS, data=sp_at_p1)
         self.m_collision_curve_sp_at_p1.name = "sp @ p1"
-        self.m_collision_curve_sp_at_p2      = pd.read_csv(collision_curve_sp_at_p2_csv_file) # 'data/p2.csv'
+        self.m_collision_curve_sp_at_p2      = pd.DataFrame(columns=ccl.ENVELOPE_COLUMNS, data=sp_at_p2)
         self.m_collision_curve_sp_at_p2.name = "sp @ p2"
 
-    def build_collision_curves(self, curve_size):
-        collision_curves = []
         self.m_interpolated_collision_curves = []
-        
-        # first one
-        collision_curves.append(self.m_collision_curve_sp_at_p1)
-
-        if curve_size >= 2:
-            # insert segment
-            segment_size = curve_size - 2
-            if segment_size > 0:
-                down_list = self.calculate_segments(segment_size, 'Down')
-                upper_list = self.calculate_segments(segment_size, 'Upper')
-                for i in range(segment_size):
-                    dict = { 'Angle': self.m_collision_curve_sp_at_p1['Angle'],
-                            'Upper': upper_list[i],  
-                            'Down': down_list[i] }
-                    df = pd.DataFrame(dict)
-                    df.name = f'segment {i}'
-                    collision_curves.append(df)
-            # last one
-            collision_curves.append(self.m_collision_curve_sp_at_p2)
-
-        # for collision_curve in collision_curves:
-        #     print(f'<{collision_curve.name}>')
-        #     display(collision_curve)
-        #     print('---------------------------')
-
-        for collision_curve in collision_curves:
-            interpolated_collision_curve = self.interpolate_collision_curve(collision_curve)
-            self.m_interpolated_collision_curves.append(interpolated_collision_curve)    
+        self.m_collision_curves_index        = None
+        self.m_collision_curves_interpolator = None
+        self.m_curve_cache                   = OrderedDict()
+        self.m_cache_size                    = cache_size
+        self.m_cache_hits                    = 0
+        self.m_cache_misses                  = 0
+        self.m_cache_dir                     = cache_dir # where build_gantry_windows persists its tables, None keeps them in memory only
+        # held while the family is built and read, the asynchronous mode of the drawer builds it off the kernel thread
+        self.m_lock                          = threading.RLock()
+        self.m_source_hash                   = self.hash_source_data()
+        self.m_envelopes                     = self.calculate_envelopes()
+
+    def hash_source_data(self):
+        """
+        content hash of the P1/P2 envelopes, part of the key of the curve family cache and of the on-disk tables
+        """
+        sha = hashlib.sha1()
+        for collision_curve in [self.m_collision_curve_sp_at_p1, self.m_collision_curve_sp_at_p2]:
+            sha.update(collision_curve.name.encode('utf-8'))
+            sha.update(collision_curve[['Angle', 'Upper', 'Down']].to_numpy(dtype=np.float64).tobytes())
+        return sha.hexdigest()
+
+    def invalidate_cache(self):
+        with self.m_lock:
+            self.m_curve_cache.clear()
+            self.m_source_hash = self.hash_source_data()
+            self.m_envelopes = self.calculate_envelopes()
+            # the current family was built from the old envelopes, rebuild it with the same curve_size and kind
+            if self.m_collision_curves_interpolator is not None:
+                self.build_collision_curves(len(self.m_interpolated_collision_curves), self.m_collision_curves_interpolator.m_kind)
+
+    def calculate_envelopes(self):
+        # [angles, upper, down] of the envelopes at P1 and P2, for evaluate_limits
+        return [[collision_curve[column].to_numpy(dtype=float) for column in ['Angle', 'Upper', 'Down']]
+                for collision_curve in [self.m_collision_curve_sp_at_p1, self.m_collision_curve_sp_at_p2]]
+
+    def evaluate_limits(self, sp_fraction, angle):
+        """
+        [upper, down] at any sub-pallet position between P1 (sp_fraction=0) and P2 (sp_fraction=1),
+        bilinear over (sp_fraction, angle) straight from the envelopes, no curve of the family is built
+        """
+        sp_fraction = np.asarray(sp_fraction, dtype=float)
+        angle = np.asarray(angle, dtype=float)
+        [[p1_angles, p1_upper, p1_down], [p2_angles, p2_upper, p2_down]] = self.m_envelopes
+        limits = []
+        for [at_p1, at_p2] in [[np.interp(angle, p1_angles, p1_upper), np.interp(angle, p2_angles, p2_upper)],
+                               [np.interp(angle, p1_angles, p1_down), np.interp(angle, p2_angles, p2_down)]]:
+            limits.append((at_p1 + sp_fraction * (at_p2 - at_p1))[()])
+        return limits
+
+    def cache_info(self):
+        return { 'hits': self.m_cache_hits,
+                'misses': self.m_cache_misses,
+                'size': len(self.m_curve_cache),
+                'max_size': self.m_cache_size }
+
+    def update_curve_at_p1(self, data, name='sp @ p1'):
+        # the new envelope has to keep the angle grid of the one at P2
+        data = np.asarray(data, dtype=float)
+        ccl.validate_collision_envelopes(data, self.m_collision_curve_sp_at_p2[ccl.ENVELOPE_COLUMNS].to_numpy(dtype=float), name, self.m_collision_curve_sp_at_p2.name)
+        self.m_collision_curve_sp_at_p1 = pd.DataFrame(columns=ccl.ENVELOPE_COLUMNS, data=data)
+        self.m_collision_curve_sp_at_p1.name = name
+        self.invalidate_cache()
+
+    def update_curve_at_p2(self, data, name='sp @ p2'):
+        # the new envelope has to keep the angle grid of the one at P1
+        data = np.asarray(data, dtype=float)
+        ccl.validate_collision_envelopes(self.m_collision_curve_sp_at_p1[ccl.ENVELOPE_COLUMNS].to_numpy(dtype=float), data, self.m_collision_curve_sp_at_p1.name, name)
+        self.m_collision_curve_sp_at_p2 = pd.DataFrame(columns=ccl.ENVELOPE_COLUMNS, data=data)
+        self.m_collision_curve_sp_at_p2.name = name
+        self.invalidate_cache()
+
+    @ccp.profiler.timed('generator.build_collision_curves')
+    def build_collision_curves(self, curve_size, kind='linear'):
+        # makes the family the current one, which the lookups of the drawer use
+        with self.m_lock:
+            [self.m_interpolated_collision_curves, self.m_collision_curves_index, self.m_collision_curves_interpolator] = self.calculate_collision_curves(curve_size, kind)
+
+    def calculate_collision_curves(self, curve_size, kind='linear'):
+        """
+        [curves, index, interpolator] of a family, without touching the current one.
+        the interpolated curves only depend on the envelopes, curve_size and kind,
+        so the widget events which just move the tilt angle or vertical reuse the cached family
+        """
+        with self.m_lock:
+            key = (curve_size, kind, self.m_source_hash)
+            cached_collision_curves = self.m_curve_cache.get(key)
+            if cached_collision_curves is not None:
+                self.m_curve_cache.move_to_end(key)
+                self.m_cache_hits += 1
+                return cached_collision_curves
+
+            self.m_cache_misses += 1
+            columns = ['Upper', 'Down']
+            # first one
+            curve_names = [self.m_collision_curve_sp_at_p1.name]
+            limits = [self.m_collision_curve_sp_at_p1[columns].to_numpy(dtype=float)[np.newaxis]]
+
+            if curve_size >= 2:
+                # insert segment
+                segment_size = curve_size - 2
+                if segment_size > 0:
+                    curve_names += [f'segment {i}' for i in range(segment_size)]
+                    limits.append(self.calculate_segments(segment_size))
+                # last one
+                curve_names.append(self.m_collision_curve_sp_at_p2.name)
+                limits.append(self.m_collision_curve_sp_at_p2[columns].to_numpy(dtype=float)[np.newaxis])
+
+            # one shared grid of breakpoints for the whole family, sampled once onto the 1/10 degree grid
+            interpolator = ccip.collision_curves_interpolator(self.m_collision_curve_sp_at_p1['Angle'].to_numpy(dtype=float), np.concatenate(limits), kind)
+            angles = interpolator.grid()
+            interpolated_limits = interpolator.evaluate(angles)
+            index = cci.collision_curves_index(curve_names, angles, interpolated_limits)
+            # the DataFrames are only built for the debug views which ask for them
+            collision_curves = [ccip.collision_curves_frames(curve_names, angles, interpolated_limits), index, interpolator]
+
+            self.m_curve_cache[key] = collision_curves
+            while len(self.m_curve_cache) > self.m_cache_size:
+                self.m_curve_cache.popitem(last=False)
+            return collision_curves
+
+    @ccp.profiler.timed('generator.build_gantry_windows')
+    def build_gantry_windows(self, curve_size, bore_down_limit, first_vertical=90, vertical_offset=0.7, kind='linear'):
+        """
+        "vertical -> allowed tilt window" tables of every curve of the family, as an array of shape
+        (curve, vertical, [vertical, valid, x1, x2]). With a cache_dir the tables are written to a .npy
+        keyed by the content hash of the envelopes and later sessions load them memory-mapped
+        """
+        key = hashlib.sha1(repr((self.m_gantry_windows_version, self.m_source_hash, curve_size, kind,
+                                float(bore_down_limit), float(first_vertical), float(vertical_offset))).encode('utf-8')).hexdigest()
+        path = None
+        if self.m_cache_dir is not None:
+            path = os.path.join(self.m_cache_dir, f'gantry_windows_{key}.npy')
+            if os.path.exists(path):
+                return np.load(path, mmap_mode='r')
+
+        # a family of its own, the current one of the drawer stays as it is
+        index = self.calculate_collision_curves(curve_size, kind)[1]
+        verticals = np.arange(first_vertical, int(bore_down_limit)+1) + vertical_offset
+        gantry_windows = np.empty((len(index), len(verticals), 4))
+        for curve_index in range(len(index)):
+            [valid, x1, x2] = cci.calculate_gantry_windows(index.m_angles, index.m_limits[curve_index, :, 0], index.m_limits[curve_index, :, 1], verticals)
+            gantry_windows[curve_index] = np.column_stack([verticals, valid, x1, x2])
+
+        if path is not None:
+            os.makedirs(self.m_cache_dir, exist_ok=True)
+            # write next to the target and rename, so a concurrent reader never maps a partial file
+            temporary_path = f'{path}.{os.getpid()}.tmp'
+            with open(temporary_path, 'wb') as file:
+                np.save(file, gantry_windows)
+            os.replace(temporary_path, path)
+        return gantry_windows
 
     # pick one kind: linear, nearest
+    @ccp.profiler.timed('generator.interpolate_collision_curve')
     def interpolate_collision_curve(self, collision_curve, kind='linear'):
-        angle = collision_curve['Angle']
-        down = collision_curve['Down']
-        upper = collision_curve['Upper']
-
-        # interpolate
-        f_down = interpolate.interp1d(angle, down, kind=kind) #f is a function
-        f_upper = interpolate.interp1d(angle, upper, kind=kind) #f is a function
-
-        # down 插值数据
-        count = len(collision_curve['Angle'])
-        first_angle = collision_curve['Angle'][0]
-        last_angle = collision_curve['Angle'][count-1]
-        angle_interpolate = np.linspace(first_angle, last_angle, last_angle-first_angle+1)
-        down_interpolate = f_down(angle_interpolate) 
-
-        # upper 插值数据
-        upper_interpolate = f_upper(angle_interpolate) 
-
-        dict = { 'Angle': angle_interpolate,
-                'Upper': upper_interpolate,  
-                'Down': down_interpolate }
-
-        interpolated_collision_curve = pd.DataFrame(dict)
-        interpolated_collision_curve.name = collision_curve.name
-        
-        # print(f'<{interpolated_collision_curve.name}>')
-        # display(interpolated_collision_curve)
-        # print('---------------------------')
-
-        return interpolated_collision_curve
-
-    def calculate_segments(self, size, column_name):
-        segments = []
-        if size > 0:
-            count = len(self.m_collision_curve_sp_at_p2[column_name])
-            for x in range(count):
-                p1 = self.m_collision_curve_sp_at_p1[column_name].iloc[x]
-                p2 = self.m_collision_curve_sp_at_p2[column_name].iloc[x]
-                step = (p1 - p2) / (size+1)
-                segment = []
-                element = p1
-                for i in range(size):
-                    element = element - step
-                    segment.append(element)
-                segments.append(segment)            
-            segments = np.transpose(segments)
-        return segments
\ No newline at end of file
+        # a single curve, build_collision_curves interpolates the whole family at once
+        interpolator = ccip.collision_curves_interpolator(collision_curve['Angle'].to_numpy(dtype=float),
+                                                          collision_curve[['Upper', 'Down']].to_numpy(dtype=float)[np.newaxis], kind)
+        angles = interpolator.grid()
+        return ccip.collision_curves_frames([collision_curve.name], angles, interpolator.evaluate(angles))[0]
+
+    def calculate_segments(self, size):
+        """
+        intermediate curves between the envelopes at P1 and P2, evenly spaced along the sub-pallet axis,
+        returned as an ndarray of shape (size, angle, 2), the last axis being [upper, down]
+        """
+        columns = ['Upper', 'Down']
+        p1 = self.m_collision_curve_sp_at_p1[columns].to_numpy(dtype=float)
+        p2 = self.m_collision_curve_sp_at_p2[columns].to_numpy(dtype=float)
+        if size <= 0:
+            return np.empty((0,) + p1.shape)
+        # segment i sits at (i+1)/(size+1) of the way from P1 to P2, stepped down from P1 one step at a time
+        # so the values, and the gantry windows compared against them, stay bit for bit those of the original loop
+        step = (p1 - p2) / (size+1)
+        return np.subtract.accumulate(np.concatenate([p1[np.newaxis], np.repeat(step[np.newaxis], size, axis=0)]), axis=0)[1:]
@@ -0,0 +1,120 @@
+import math
+import numpy as np
+import pandas as pd
+
+def pick_up_continuous_runs(mask, angles, key_angle=0.0, interval=1.0):
+    """
+    for every row of mask (vertical, angle), the first and last position of the run of selected angles
+    spaced by interval which contains key_angle, or of the last run when key_angle is not selected
+    """
+    linked = np.zeros(len(angles), dtype=bool)
+    linked[1:] = np.abs(np.diff(angles)) == interval
+    starts = mask.copy()
+    starts[:, 1:] &= ~(mask[:, :-1] & linked[1:])
+    labels = np.cumsum(starts, axis=1) * mask
+
+    key_label = labels.max(axis=1)
+    key_positions = np.flatnonzero(angles == key_angle)
+    if len(key_positions) > 0:
+        key_label = np.where(labels[:, key_positions[0]] > 0, labels[:, key_positions[0]], key_label)
+
+    in_run = (labels == key_label[:, np.newaxis]) & mask
+    first = np.argmax(in_run, axis=1)
+    last = in_run.shape[1] - 1 - np.argmax(in_run[:, ::-1], axis=1)
+    return first, last
+
+def calculate_gantry_windows(angles, upper, down, verticals, key_angle=0.0, interval=1.0, chunk_size=1024):
+    """
+    allowed tilt window [x1, x2] around key_angle of one collision curve at every vertical level,
+    returns (valid, x1, x2), x1 and x2 are 0 where the vertical level is blocked at every angle
+    """
+    angles = np.asarray(angles, dtype=float)
+    upper = np.asarray(upper, dtype=float)
+    down = np.asarray(down, dtype=float)
+    verticals = np.atleast_1d(np.asarray(verticals, dtype=float))
+
+    valid = np.zeros(len(verticals), dtype=bool)
+    x1 = np.zeros(len(verticals))
+    x2 = np.zeros(len(verticals))
+    # the masks are (vertical, angle), chunk them to bound the memory of very fine envelopes
+    for begin in range(0, len(verticals), chunk_size):
+        chunk = slice(begin, begin + chunk_size)
+        mask_down = down[np.newaxis, :] >= verticals[chunk, np.newaxis]
+        mask_upper = upper[np.newaxis, :] <= verticals[chunk, np.newaxis]
+        [first_down, last_down] = pick_up_continuous_runs(mask_down, angles, key_angle, interval)
+        [first_upper, last_upper] = pick_up_continuous_runs(mask_upper, angles, key_angle, interval)
+
+        valid[chunk] = mask_down.any(axis=1) & mask_upper.any(axis=1)
+        x1[chunk] = np.where(valid[chunk], np.maximum(angles[first_down], angles[first_upper]), 0)
+        x2[chunk] = np.where(valid[chunk], np.minimum(angles[last_down], angles[last_upper]), 0)
+    return valid, x1, x2
+
+class collision_curves_index():
+    """
+    dense lookup table over a family of interpolated collision curves, answers the limit queries
+    of the drawer without building pandas temporaries
+    """
+
+    def __init__(self, curve_names, angles, limits):
+        # limits: (curve, angle, [upper, down]) on the shared angle grid
+        self.m_curve_names = list(curve_names)
+        self.m_angles = np.asarray(angles, dtype=float)
+        self.m_limits = np.asarray(limits, dtype=float)
+
+        self.m_first_angle = self.m_angles[0]
+        steps = np.diff(self.m_angles)
+        self.m_step = steps[0] if len(steps) > 0 else 1.0
+        self.m_is_uniform = len(steps) == 0 or bool(np.allclose(steps, self.m_step))
+
+    def __len__(self):
+        return len(self.m_curve_names)
+
+    def angle_to_position(self, angle):
+        """
+        position of the first grid angle >= angle, same as df.loc[df['Angle'] >= angle].iat[0],
+        clipped to the grid for angles outside of it
+        """
+        if isinstance(angle, (int, float)):
+            return self.scalar_angle_to_position(angle)
+
+        angle = np.asarray(angle, dtype=float)
+        last_position = len(self.m_angles) - 1
+        if self.m_is_uniform:
+            position = np.clip(np.ceil((angle - self.m_first_angle) / self.m_step).astype(int), 0, last_position)
+            # the division may round across a grid point, settle it against the grid itself
+            position = position - ((position > 0) & (self.m_angles[position - 1] >= angle))
+            position = position + ((position < last_position) & (self.m_angles[position] < angle))
+        else:
+            position = np.clip(np.searchsorted(self.m_angles, angle, side='left'), 0, last_position)
+        return position if position.ndim > 0 else int(position)
+
+    def scalar_angle_to_position(self, angle):
+        # plain python path for the single queries of the interactive and monitoring loops
+        last_position = len(self.m_angles) - 1
+        if self.m_is_uniform:
+            position = min(max(math.ceil((angle - self.m_first_angle) / self.m_step), 0), last_position)
+            if position > 0 and self.m_angles[position - 1] >= angle:
+                position -= 1
+            elif position < last_position and self.m_angles[position] < angle:
+                position += 1
+            return position
+        return min(int(np.searchsorted(self.m_angles, angle, side='left')), last_position)
+
+    def limits_at(self, curve_index, angle):
+        limits = self.m_limits[curve_index, self.angle_to_position(angle)]
+        return limits[..., 0], limits[..., 1]
+
+    def is_colliding(self, curve_index, angle, vertical_encoder_pos, bore_down_limit=np.inf):
+        upper, down = self.limits_at(curve_index, angle)
+        return (vertical_encoder_pos > np.minimum(down, bore_down_limit)) | (vertical_encoder_pos < upper)
+
+    def gantry_windows(self, curve_index, verticals):
+        """
+        table of the allowed tilt window of one curve for each vertical encoder position
+        """
+        verticals = np.atleast_1d(np.asarray(verticals, dtype=float))
+        [valid, x1, x2] = calculate_gantry_windows(self.m_angles, self.m_limits[curve_index, :, 0], self.m_limits[curve_index, :, 1], verticals)
+        return pd.DataFrame({ 'Vertical': verticals,
+                            'Valid': valid,
+                            'X1': x1,
+                            'X2': x2 })
@@ -0,0 +1,84 @@
+from collections.abc import Sequence
+import numpy as np
+import pandas as pd
+
+
+class collision_curves_interpolator():
+    """
+    closed form piecewise linear (or nearest) evaluation of a family of collision curves which share
+    one angle grid of breakpoints, the breakpoints, values and slopes are plain arrays and a value is
+    only computed at the angles asked for. gives the same numbers as a scipy interp1d(kind=kind) per curve
+    """
+    __slots__ = ['m_kind', 'm_breakpoints', 'm_values', 'm_slopes', 'm_bounds']
+
+    def __init__(self, breakpoints, values, kind='linear'):
+        # breakpoints: (angle,), values: (curve, angle, [upper, down])
+        if kind not in ('linear', 'nearest'):
+            raise ValueError(f"kind must be 'linear' or 'nearest', got {kind!r}")
+        breakpoints = np.asarray(breakpoints, dtype=float)
+        values = np.asarray(values, dtype=float)
+        if len(breakpoints) < 2 or values.ndim != 3 or values.shape[1] != len(breakpoints):
+            raise ValueError(f'expected values of shape (curve, {len(breakpoints)}, 2) over at least 2 breakpoints, got {values.shape}')
+        self.m_kind = kind
+        self.m_breakpoints = breakpoints
+        self.m_values = values
+        # slope of the segment starting at each breakpoint, the last breakpoint starts a flat one
+        slopes = np.diff(values, axis=1) / np.diff(breakpoints)[np.newaxis, :, np.newaxis]
+        self.m_slopes = np.concatenate([slopes, np.zeros_like(values[:, :1])], axis=1)
+        # halfway points between the breakpoints, halved before the addition like interp1d does
+        half = breakpoints / 2.0
+        self.m_bounds = half[1:] + half[:-1]
+
+    def __len__(self):
+        return len(self.m_values)
+
+    def grid(self):
+        # the 1/10 degree grid the curves are drawn and looked up on
+        first_angle = self.m_breakpoints[0]
+        last_angle = self.m_breakpoints[-1]
+        return np.linspace(first_angle, last_angle, int(last_angle-first_angle)+1)
+
+    def evaluate(self, angles, curve_index=slice(None)):
+        """
+        [upper, down] of the curve(s) at the angles, shape (curve, angle, 2) or (angle, 2) for a single curve.
+        angles outside of the breakpoints raise a ValueError
+        """
+        angles = np.asarray(angles, dtype=float)
+        if np.any(angles < self.m_breakpoints[0]) or np.any(angles > self.m_breakpoints[-1]):
+            raise ValueError(f'angles must be within [{self.m_breakpoints[0]}, {self.m_breakpoints[-1]}]')
+        if self.m_kind == 'nearest':
+            # a halfway angle goes to the lower breakpoint
+            return self.m_values[curve_index, np.searchsorted(self.m_bounds, angles, side='left')]
+        # the segment with breakpoint <= angle, evaluated in the same order of operations as np.interp
+        position = np.clip(np.searchsorted(self.m_breakpoints, angles, side='right') - 1, 0, len(self.m_breakpoints)-1)
+        offset = (angles - self.m_breakpoints[position])[..., np.newaxis]
+        return self.m_slopes[curve_index, position] * offset + self.m_values[curve_index, position]
+
+
+class collision_curves_frames(Sequence):
+    """
+    the interpolated curves of a family as DataFrames with the columns Angle, Upper, Down,
+    a frame is only built when it is asked for, e.g. by the debug views of the drawer
+    """
+    __slots__ = ['m_curve_names', 'm_angles', 'm_limits', 'm_frames']
+
+    def __init__(self, curve_names, angles, limits):
+        self.m_curve_names = curve_names
+        self.m_angles = angles
+        self.m_limits = limits
+        self.m_frames = [None] * len(curve_names)
+
+    def __len__(self):
+        return len(self.m_curve_names)
+
+    def __getitem__(self, curve_index):
+        if isinstance(curve_index, slice):
+            return [self[i] for i in range(*curve_index.indices(len(self)))]
+        frame = self.m_frames[curve_index]
+        if frame is None:
+            frame = pd.DataFrame({ 'Angle': self.m_angles,
+                                 'Upper': self.m_limits[curve_index, :, 0],
+                                 'Down': self.m_limits[curve_index, :, 1] })
+            frame.name = self.m_curve_names[curve_index]
+            self.m_frames[curve_index] = frame
+        return frame
@@ -0,0 +1,105 @@
+import csv
+import os
+import warnings
+import numpy as np
+
+
+# column order of the loaded arrays and of the binary files
+ENVELOPE_COLUMNS = ['Angle', 'Upper', 'Down']
+# the envelopes are given in mm with at most this many decimals, float32 files are rounded back to them
+ENVELOPE_DECIMALS = 3
+
+
+def read_collision_envelope_csv(source):
+    """
+    csv with the columns Angle, Upper, Down in any order -> float64 array of shape (rows, 3).
+    the data files are saved with a UTF-8 BOM, utf-8-sig strips it from the first header
+    """
+    if hasattr(source, 'read'):
+        lines = source
+        name = getattr(source, 'name', 'envelope')
+    else:
+        lines = open(source, encoding='utf-8-sig', newline='')
+        name = source
+    try:
+        reader = csv.reader(lines)
+        header = [column.strip().lstrip('\ufeff') for column in next(reader)]
+        missing = [column for column in ENVELOPE_COLUMNS if column not in header]
+        if len(missing) > 0:
+            raise ValueError(f'{name}: missing column(s) {missing}, got {header}')
+        positions = [header.index(column) for column in ENVELOPE_COLUMNS]
+        rows = []
+        for line_number, row in enumerate(reader, start=2):
+            if len(row) == 0 or all(len(value.strip()) == 0 for value in row):
+                continue
+            try:
+                rows.append([float(row[position]) for position in positions])
+            except (ValueError, IndexError):
+                raise ValueError(f'{name}:{line_number}: cannot read {row} as {ENVELOPE_COLUMNS}')
+    finally:
+        if lines is not source:
+            lines.close()
+    return np.array(rows, dtype=np.float64).reshape(-1, len(ENVELOPE_COLUMNS))
+
+
+def validate_collision_envelope(data, name='envelope'):
+    """
+    raises ValueError for envelopes the generator cannot use, warns about angles where Upper > Down,
+    the couch is blocked at every vertical position there
+    """
+    data = np.asarray(data, dtype=np.float64)
+    if data.ndim != 2 or data.shape[1] != len(ENVELOPE_COLUMNS):
+        raise ValueError(f'{name}: expected the columns {ENVELOPE_COLUMNS}, got an array of shape {data.shape}')
+    if len(data) < 2:
+        raise ValueError(f'{name}: at least 2 rows are needed to interpolate, got {len(data)}')
+    if not np.all(np.isfinite(data)):
+        raise ValueError(f'{name}: contains NaN or infinite values')
+    angles = data[:, 0]
+    if not np.all(np.diff(angles) > 0):
+        raise ValueError(f'{name}: angles must be sorted and unique')
+    blocked = data[:, 1] > data[:, 2]
+    if np.any(blocked):
+        warnings.warn(f'{name}: Upper > Down at angle(s) {angles[blocked].tolist()}, every vertical position collides there')
+    return data
+
+
+def validate_collision_envelopes(p1, p2, p1_name='sp @ p1', p2_name='sp @ p2'):
+    # the intermediate curves are built row by row, both envelopes must share one angle grid
+    validate_collision_envelope(p1, p1_name)
+    validate_collision_envelope(p2, p2_name)
+    if len(p1) != len(p2) or not np.array_equal(p1[:, 0], p2[:, 0]):
+        raise ValueError(f'{p1_name} and {p2_name} must share the same angles')
+
+
+def load_collision_envelope(source, validate=True):
+    """
+    loads an envelope from a .csv (or file-like csv) or from a binary .npy written by save_collision_envelope,
+    the .npy is memory-mapped and needs no parsing. an array of shape (rows, [Angle, Upper, Down]) is taken as it is
+    """
+    if isinstance(source, np.ndarray):
+        data = source
+        name = 'envelope'
+    elif isinstance(source, (str, os.PathLike)) and os.fspath(source).endswith('.npy'):
+        data = np.load(source, mmap_mode='r')
+        if data.dtype != np.float64:
+            data = np.round(data.astype(np.float64), ENVELOPE_DECIMALS)
+        name = os.fspath(source)
+    else:
+        data = read_collision_envelope_csv(source)
+        name = source if isinstance(source, str) else getattr(source, 'name', 'envelope')
+    if validate:
+        validate_collision_envelope(data, name)
+    return data
+
+
+def save_collision_envelope(data, npy_file, dtype=np.float32):
+    """
+    writes an envelope as a (rows, [Angle, Upper, Down]) .npy, float32 halves the size and
+    load_collision_envelope rounds it back to the csv values
+    """
+    data = validate_collision_envelope(data, npy_file)
+    np.save(npy_file, data.astype(dtype))
+
+
+def convert_collision_envelope(csv_file, npy_file, dtype=np.float32):
+    save_collision_envelope(read_collision_envelope_csv(csv_file), npy_file, dtype)
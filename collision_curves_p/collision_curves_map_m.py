@@ -0,0 +1,138 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+import numpy as np
+
+
+def calculate_map_rows(map_file, rows, high_light_index, curve_limits, verticals, bore_down_limit):
+    """
+    worker of collision_curves_map_generator, fills map[rows] with the clearance margins,
+    high_light_index: curve of each sp of the rows, curve_limits: (curve, angle, [upper, down]) of the family on the angles of the map
+    """
+    collision_map = np.load(map_file, mmap_mode='r+')
+    # no curve is highlighted outside of the family, like get_limits_at_angle of the drawer
+    highlighted = (high_light_index >= 0) & (high_light_index < len(curve_limits))
+    limits = np.where(highlighted[:, np.newaxis, np.newaxis], curve_limits[np.clip(high_light_index, 0, len(curve_limits) - 1)], 0)
+    upper = limits[:, :, 0, np.newaxis]
+    down = np.minimum(limits[:, :, 1, np.newaxis], bore_down_limit)
+    vertical = verticals[np.newaxis, np.newaxis, :]
+    collision_map[rows[0]:rows[1]] = np.minimum(vertical - upper, down - vertical)
+    collision_map.flush()
+    return rows
+
+
+class collision_curves_map_generator():
+    """
+    clearance margin of every (sub-pallet, tilt angle, vertical) cell of the configuration space,
+    negative margins are collisions, NaN cells are outside of the tilt range of the envelopes. The map is written to a memory-mapped .npy of shape
+    (sp, angle, vertical) by a pool of worker processes, its axes go to a companion _axes.npz
+    """
+    def __init__(self, drawer, curve_size=None, bore_down_limit=None):
+        self.m_drawer          = drawer
+        self.m_curve_size      = drawer.m_default_curve_size if curve_size is None else curve_size
+        self.m_bore_down_limit = drawer.m_bore_down_limit if bore_down_limit is None else bore_down_limit
+
+        # the full grid: 1/10 degree tilt steps, 1 mm vertical steps over the range of the vertical box of run(), 1 mm sub-pallet steps from P1 to P3
+        self.m_angles         = np.arange(-300, 301, dtype=float)
+        self.m_verticals      = drawer.convert_vertical_display_pos_to_encoder_pos(np.arange(0, 561, dtype=float))[::-1]
+        self.m_sp_encoder_pos = np.arange(min(drawer.m_p1_pos, drawer.m_p3_pos), max(drawer.m_p1_pos, drawer.m_p3_pos) + 1, dtype=float)
+
+    def calculate_curve_limits(self):
+        """
+        [curve of each sub-pallet position, (curve, angle, [upper, down]) limits of the family on the angles of the map],
+        the limits are NaN outside of the tilt range of the envelopes. the per cell work is left to the workers
+        """
+        drawer = self.m_drawer
+        # a family of its own, the current one of the generator is left to the drawer
+        index = drawer.m_generator.calculate_collision_curves(self.m_curve_size)[1]
+        sp_relative_pos = drawer.convert_sp_encoder_pos_to_relative_pos(self.m_sp_encoder_pos)
+        high_light_index = drawer.calculate_high_light_index(sp_relative_pos, self.m_curve_size)
+        curve_limits = index.m_limits[:, index.angle_to_position(self.m_angles)]
+        # the lookup clamps to the ends of the envelopes, which would read as a margin there
+        inside = (self.m_angles >= index.m_angles[0]) & (self.m_angles <= index.m_angles[-1])
+        return [high_light_index, np.where(inside[np.newaxis, :, np.newaxis], curve_limits, np.nan)]
+
+    def generate(self, map_file, processes=None, chunk_rows=8):
+        """
+        processes=None uses every core, processes=1 computes in this process
+        """
+        if processes is None:
+            processes = os.cpu_count() or 1
+        [high_light_index, curve_limits] = self.calculate_curve_limits()
+        shape = (len(self.m_sp_encoder_pos), len(self.m_angles), len(self.m_verticals))
+        collision_map = np.lib.format.open_memmap(map_file, mode='w+', dtype=np.float32, shape=shape)
+        del collision_map
+
+        prefix = os.path.splitext(map_file)[0]
+        np.savez(f'{prefix}_axes.npz', sp_encoder_pos=self.m_sp_encoder_pos, angles=self.m_angles, verticals=self.m_verticals,
+                 bore_down_limit=self.m_bore_down_limit, curve_size=self.m_curve_size)
+
+        row_chunks = [[begin, min(begin + chunk_rows, shape[0])] for begin in range(0, shape[0], chunk_rows)]
+        if processes == 1:
+            for rows in row_chunks:
+                calculate_map_rows(map_file, rows, high_light_index[rows[0]:rows[1]], curve_limits, self.m_verticals, self.m_bore_down_limit)
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                futures = [executor.submit(calculate_map_rows, map_file, rows, high_light_index[rows[0]:rows[1]], curve_limits, self.m_verticals, self.m_bore_down_limit)
+                           for rows in row_chunks]
+                for future in futures:
+                    future.result()
+        return collision_curves_map_viewer(map_file)
+
+
+class collision_curves_map_viewer():
+    """
+    heatmap slices of a map written by collision_curves_map_generator, read memory-mapped
+    """
+    def __init__(self, map_file):
+        self.m_map = np.load(map_file, mmap_mode='r')
+        axes = np.load(f'{os.path.splitext(map_file)[0]}_axes.npz')
+        self.m_sp_encoder_pos  = axes['sp_encoder_pos']
+        self.m_angles          = axes['angles']
+        self.m_verticals       = axes['verticals']
+        self.m_bore_down_limit = float(axes['bore_down_limit'])
+        self.m_curve_size      = int(axes['curve_size'])
+
+    def nearest(self, values, value):
+        return int(np.abs(values - value).argmin())
+
+    def margin_at(self, sp_encoder_pos, angle, vertical_encoder_pos):
+        return self.m_map[self.nearest(self.m_sp_encoder_pos, sp_encoder_pos),
+                          self.nearest(self.m_angles, angle),
+                          self.nearest(self.m_verticals, vertical_encoder_pos)]
+
+    def slice_at_sp(self, sp_encoder_pos):
+        # (vertical, angle)
+        return np.asarray(self.m_map[self.nearest(self.m_sp_encoder_pos, sp_encoder_pos)]).T
+
+    def slice_at_angle(self, angle):
+        # (vertical, sp)
+        return np.asarray(self.m_map[:, self.nearest(self.m_angles, angle)]).T
+
+    def draw_heatmap(self, data, x, title, xlabel, clip=100):
+        import pylab as pl
+        pl.imshow(data, cmap='RdYlGn', vmin=-clip, vmax=clip, aspect='auto', interpolation='nearest',
+                  extent=[x[0], x[-1], self.m_verticals[-1], self.m_verticals[0]])
+        pl.colorbar(label='Clearance(mm)')
+        pl.contour(x, self.m_verticals, data, levels=[0], colors='black', linewidths=0.8)
+        pl.xlabel(xlabel)
+        pl.ylabel('Vertical(mm)')
+        pl.title(title, fontsize=10)
+        pl.show()
+
+    def draw_slice_at_sp(self, sp_encoder_pos):
+        sp_encoder_pos = self.m_sp_encoder_pos[self.nearest(self.m_sp_encoder_pos, sp_encoder_pos)]
+        self.draw_heatmap(self.slice_at_sp(sp_encoder_pos), self.m_angles,
+                          f'Clearance for SP @ Encoder={sp_encoder_pos:.0f}mm', 'Angle(1/10 Degrees)')
+
+    def draw_slice_at_angle(self, angle):
+        angle = self.m_angles[self.nearest(self.m_angles, angle)]
+        self.draw_heatmap(self.slice_at_angle(angle), self.m_sp_encoder_pos,
+                          f'Clearance for Tilt @ {angle:.0f}', 'SP Encoder(mm)')
+
+    def run(self):
+        import ipywidgets as widgets
+        from ipywidgets import interact
+        interact(self.draw_slice_at_sp, sp_encoder_pos=widgets.FloatSlider(min=self.m_sp_encoder_pos[0], max=self.m_sp_encoder_pos[-1], step=1,
+                                                                           value=self.m_sp_encoder_pos[0], description='SP Pos (mm):'))
+        interact(self.draw_slice_at_angle, angle=widgets.IntSlider(min=int(self.m_angles[0]), max=int(self.m_angles[-1]), step=5,
+                                                                   value=0, description='Tilt (10th):'))
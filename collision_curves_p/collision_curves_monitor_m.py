@@ -0,0 +1,121 @@
+import asyncio
+from collections import deque, namedtuple
+
+
+# kind: 'collision', 'near miss' or 'clear', margin: clearance to the closer limit in mm, negative in collision
+collision_event = namedtuple('collision_event', ['timestamp', 'kind', 'angle', 'vertical_encoder_pos', 'sp_encoder_pos', 'curve', 'margin'])
+
+
+def parse_telemetry_line(line):
+    """
+    'timestamp, angle, vertical, sp_encoder_pos' -> tuple of floats, None for headers, comments and blank lines
+    """
+    line = line.strip()
+    if len(line) == 0 or line[0] == '#':
+        return None
+    try:
+        [timestamp, angle, vertical_display_pos, sp_encoder_pos] = [float(value) for value in line.split(',')]
+    except ValueError:
+        return None
+    return (timestamp, angle, vertical_display_pos, sp_encoder_pos)
+
+
+def read_telemetry_log(log_file):
+    with open(log_file, encoding='utf-8-sig') as file:
+        for line in file:
+            sample = parse_telemetry_line(line)
+            if sample is not None:
+                yield sample
+
+
+async def replay_telemetry_server(log_file, host='127.0.0.1', port=8765, rate_hz=1000):
+    """
+    stands in for the couch controller, streams a telemetry log to every client at rate_hz
+    """
+    async def serve(reader, writer):
+        period = 1.0 / rate_hz
+        try:
+            with open(log_file, encoding='utf-8-sig') as file:
+                for line in file:
+                    writer.write(line.encode('utf-8'))
+                    await writer.drain()
+                    await asyncio.sleep(period)
+        finally:
+            writer.close()
+    return await asyncio.start_server(serve, host, port)
+
+
+class collision_curves_monitor():
+    """
+    incremental collision check of a telemetry stream of (timestamp, angle, vertical display pos, sp encoder pos).
+    the limits of the curve family are flattened into plain python lists so one sample costs a few
+    microseconds, events are only emitted when the state changes and the event history is bounded
+    """
+    def __init__(self, drawer, curve_size=None, bore_down_limit=None, near_miss_margin=10.0, history=1000):
+        self.m_drawer           = drawer
+        self.m_near_miss_margin = near_miss_margin
+        self.m_events           = deque(maxlen=history)
+        self.m_state            = 'clear'
+        self.m_samples          = 0
+        self.m_curve_size       = drawer.m_default_curve_size if curve_size is None else curve_size
+
+        bore_down_limit = drawer.m_bore_down_limit if bore_down_limit is None else bore_down_limit
+        # a family of its own, the current one of the generator may change under the monitor
+        self.m_index = drawer.m_generator.calculate_collision_curves(self.m_curve_size)[1]
+        self.m_upper = self.m_index.m_limits[:, :, 0].tolist()
+        self.m_down = [[min(down, bore_down_limit) for down in curve] for curve in self.m_index.m_limits[:, :, 1].tolist()]
+
+    def update(self, timestamp, angle, vertical_display_pos, sp_encoder_pos):
+        """
+        checks one sample, returns the collision_event when the state changed, otherwise None
+        """
+        self.m_samples += 1
+        drawer = self.m_drawer
+        vertical_encoder_pos = drawer.convert_vertical_display_pos_to_encoder_pos(vertical_display_pos)
+        curve = drawer.calculate_high_light_index(drawer.convert_sp_encoder_pos_to_relative_pos(sp_encoder_pos), self.m_curve_size)
+        if 0 <= curve < len(self.m_upper):
+            position = self.m_index.scalar_angle_to_position(angle)
+            margin = min(vertical_encoder_pos - self.m_upper[curve][position], self.m_down[curve][position] - vertical_encoder_pos)
+        else:
+            # no curve is highlighted outside of the family, the drawer then flags every vertical position
+            margin = -abs(vertical_encoder_pos)
+
+        if margin < 0:
+            state = 'collision'
+        elif margin < self.m_near_miss_margin:
+            state = 'near miss'
+        else:
+            state = 'clear'
+        if state == self.m_state:
+            return None
+        self.m_state = state
+        event = collision_event(timestamp, state, angle, vertical_encoder_pos, sp_encoder_pos, curve, margin)
+        self.m_events.append(event)
+        return event
+
+    def monitor(self, samples):
+        """
+        generator of the events of an iterable of samples, e.g. read_telemetry_log('couch.log')
+        """
+        for sample in samples:
+            event = self.update(*sample)
+            if event is not None:
+                yield event
+
+    async def monitor_socket(self, host='127.0.0.1', port=8765):
+        """
+        async generator of the events of a line based telemetry socket
+        """
+        [reader, writer] = await asyncio.open_connection(host, port)
+        try:
+            while True:
+                line = await reader.readline()
+                if len(line) == 0:
+                    break
+                sample = parse_telemetry_line(line.decode('utf-8'))
+                if sample is not None:
+                    event = self.update(*sample)
+                    if event is not None:
+                        yield event
+        finally:
+            writer.close()
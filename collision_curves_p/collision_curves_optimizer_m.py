@@ -0,0 +1,202 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+import numpy as np
+import pandas as pd
+import collision_curves_p.collision_curves_drawer_m as ccd
+
+
+def range_min(sparse, curve, begin, end):
+    # min of scores[curve, begin:end] from the sparse table, +inf for empty ranges
+    length = end - begin
+    level = np.floor(np.log2(np.maximum(length, 1))).astype(int)
+    width = np.left_shift(1, level)
+    minimum = np.minimum(sparse[level, curve, begin], sparse[level, curve, np.maximum(end - width, begin)])
+    return np.where(length > 0, minimum, np.inf)
+
+
+def score_motion_windows(machine, curve_size, motion_profile, angles, tables, retraction_positions, extension_positions):
+    """
+    worker of collision_curves_window_optimizer, [worst score, mean score] over the tilt range of each (retraction, extension) pair.
+    the 'Auto' ramp only ever moves the sub-pallet towards P2, so the curve it snaps to steps up monotonically and the
+    ramp splits into one run per curve. the run boundaries are binary searched with the drawer's own formulas and
+    each run costs one range minimum query and one difference of prefix sums
+    """
+    [prefix, suffix, sparse, cumulative, scored_angles, first_curve, last_curve] = tables
+    # only the sub-pallet geometry of the machine is needed
+    drawer = ccd.collision_curves_drawer(*machine, 0, 0, None, True)
+    lengths = (extension_positions - retraction_positions)[:, np.newaxis]
+    motion_window_of_angle = (angles[retraction_positions][:, np.newaxis], angles[extension_positions][:, np.newaxis])
+
+    # offset into the ramp of the first angle on each curve after the first
+    curves = np.arange(first_curve + 1, last_curve + 1)[np.newaxis, :]
+    lo = np.zeros((len(retraction_positions), curves.shape[1]), dtype=int)
+    hi = np.repeat(lengths, curves.shape[1], axis=1)
+    while True:
+        active = lo < hi
+        if not np.any(active):
+            break
+        mid = (lo + hi) // 2
+        sp_relative_pos = drawer.calculate_sp_relative_pos('Auto', 0, angles[retraction_positions[:, np.newaxis] + mid], motion_window_of_angle, motion_profile)
+        reached = drawer.calculate_high_light_index(sp_relative_pos, curve_size) >= curves
+        hi = np.where(active & reached, mid, hi)
+        lo = np.where(active & ~reached, mid + 1, lo)
+
+    begins = retraction_positions[:, np.newaxis] + np.concatenate([np.zeros_like(lengths), lo], axis=1)
+    ends = retraction_positions[:, np.newaxis] + np.concatenate([lo, lengths], axis=1)
+    run_curves = np.arange(first_curve, last_curve + 1)[np.newaxis, :]
+    runs = range_min(sparse, run_curves, begins, ends)
+    # before the window the sub-pallet waits at P1, after it at P2
+    worst = np.minimum(np.minimum(prefix[first_curve, retraction_positions], suffix[last_curve, extension_positions]), runs.min(axis=1))
+    total = (cumulative[first_curve, retraction_positions] + cumulative[last_curve, -1] - cumulative[last_curve, extension_positions]
+             + (cumulative[run_curves, ends] - cumulative[run_curves, begins]).sum(axis=1))
+    return worst, total / scored_angles
+
+
+class collision_curves_window_optimizer():
+    """
+    searches the (retraction, extension) motion window of the 'Auto' sub-pallet mode, and optionally its motion profile,
+    for the highest worst score over the tilt range, windows of the same worst score are ranked by their mean score.
+    objective 'clearance' scores the margin of one vertical position to the limits, 'range' the reachable vertical
+    range between the upper limit and the down limit under the bore
+    """
+    def __init__(self, drawer, curve_size=None, bore_down_limit=None):
+        self.m_drawer          = drawer
+        self.m_curve_size      = drawer.m_default_curve_size if curve_size is None else curve_size
+        self.m_bore_down_limit = drawer.m_bore_down_limit if bore_down_limit is None else bore_down_limit
+        self.m_evaluated_pairs = 0
+        self.m_total_pairs     = 0
+        # tilt range the last optimize() scored
+        self.m_angle_range     = None
+        # best score of the last optimize() and how many (retraction, extension, profile) windows reach it
+        self.m_best_score      = -np.inf
+        self.m_best_ties       = 0
+        if self.m_curve_size < 2:
+            raise ValueError(f'the motion window moves the sub-pallet between at least 2 curves, got curve_size={self.m_curve_size}')
+
+        # a family of its own, the current one of the generator is left to the drawer
+        self.m_index = drawer.m_generator.calculate_collision_curves(self.m_curve_size)[1]
+        self.m_angles = self.m_index.m_angles
+        # the curves the sub-pallet snaps to at P1 and at P2
+        self.m_first_curve = int(drawer.calculate_high_light_index(drawer.m_p1_p2_dis, self.m_curve_size))
+        self.m_last_curve = int(drawer.calculate_high_light_index(0, self.m_curve_size))
+        if not 0 <= self.m_first_curve <= self.m_last_curve < len(self.m_index):
+            raise ValueError(f'the sub-pallet leaves the curve family between P1 and P2 with curve_size={self.m_curve_size}')
+
+    def calculate_scores(self, objective='clearance', vertical_display_pos=None, angle_range=None):
+        """
+        (curve, angle) score at every grid angle, +inf outside of angle_range so it never limits the worst score
+        """
+        upper = self.m_index.m_limits[:, :, 0]
+        down = np.minimum(self.m_index.m_limits[:, :, 1], self.m_bore_down_limit)
+        if objective == 'clearance':
+            vertical_display_pos = self.m_drawer.m_default_vertical if vertical_display_pos is None else vertical_display_pos
+            vertical_encoder_pos = self.m_drawer.convert_vertical_display_pos_to_encoder_pos(vertical_display_pos)
+            scores = np.minimum(vertical_encoder_pos - upper, down - vertical_encoder_pos)
+        elif objective == 'range':
+            scores = down - upper
+        else:
+            raise ValueError(f"objective must be 'clearance' or 'range', got {objective!r}")
+        if angle_range is not None:
+            inside = (self.m_angles >= angle_range[0]) & (self.m_angles <= angle_range[1])
+            scores = np.where(inside[np.newaxis, :], scores, np.inf)
+        return scores
+
+    def calculate_tables(self, scores):
+        # prefix[curve, i] = min(scores[curve, :i]), suffix[curve, i] = min(scores[curve, i:]), sparse[level, curve, i] = min(scores[curve, i:i+2**level]),
+        # cumulative[curve, i] = sum(scores[curve, :i]) over the scored angles only
+        infinity = np.full((len(scores), 1), np.inf)
+        prefix = np.concatenate([infinity, np.minimum.accumulate(scores, axis=1)], axis=1)
+        suffix = np.concatenate([np.minimum.accumulate(scores[:, ::-1], axis=1)[:, ::-1], infinity], axis=1)
+        sparse = [scores]
+        while (1 << len(sparse)) <= scores.shape[1]:
+            width = 1 << (len(sparse) - 1)
+            sparse.append(np.concatenate([np.minimum(sparse[-1][:, :-width], sparse[-1][:, width:]), np.full((len(scores), width), np.inf)], axis=1))
+        scored = np.isfinite(scores[0])
+        cumulative = np.concatenate([np.zeros((len(scores), 1)), np.cumsum(np.where(scored[np.newaxis, :], scores, 0), axis=1)], axis=1)
+        return [prefix, suffix, np.stack(sparse), cumulative, max(int(scored.sum()), 1), self.m_first_curve, self.m_last_curve]
+
+    def calculate_window_scores(self, motion_window_of_angle, objective='clearance', vertical_display_pos=None, motion_profile='linear', angle_range=None):
+        """
+        score at every grid angle of one motion window, straight from the lookups of the drawer, +inf outside of angle_range
+        """
+        drawer = self.m_drawer
+        sp_relative_pos = drawer.calculate_sp_relative_pos('Auto', 0, self.m_angles, motion_window_of_angle, motion_profile)
+        high_light_index = drawer.calculate_high_light_index(sp_relative_pos, self.m_curve_size)
+        scores = self.calculate_scores(objective, vertical_display_pos, angle_range)
+        return scores[high_light_index, np.arange(len(self.m_angles))]
+
+    def evaluate_window(self, motion_window_of_angle, objective='clearance', vertical_display_pos=None, motion_profile='linear', angle_range=None):
+        """
+        worst score over the tilt range of one motion window
+        """
+        return float(self.calculate_window_scores(motion_window_of_angle, objective, vertical_display_pos, motion_profile, angle_range).min())
+
+    def optimize(self, objective='clearance', vertical_display_pos=None, motion_profiles=('linear',), window_angles=None,
+                 angle_range=None, top=10, processes=None, chunk_size=4096):
+        """
+        the `top` best motion windows over every retraction < extension pair of window_angles, by default every
+        grid angle of the positive tilt range, as a DataFrame sorted by worst score, then by mean score.
+        angle_range defaults to the span of window_angles, outside of it the sub-pallet waits at P1 or P2 whatever
+        the window. the P1 part before and the P2 part after the window bound the worst score of a pair from above,
+        pairs whose bound cannot reach the current top are never evaluated. m_best_ties counts the windows of the
+        best worst score, which the mean score then tells apart. processes=None uses every core, processes=1
+        computes in this process
+        """
+        if processes is None:
+            processes = os.cpu_count() or 1
+        if window_angles is None:
+            window_angles = self.m_angles[self.m_angles >= 0]
+        positions = np.unique(self.m_index.angle_to_position(np.atleast_1d(np.asarray(window_angles, dtype=float))))
+        if angle_range is None:
+            angle_range = (self.m_angles[positions[0]], self.m_angles[positions[-1]])
+        self.m_angle_range = angle_range
+        [retraction, extension] = np.triu_indices(len(positions), k=1)
+        [retraction, extension] = [positions[retraction], positions[extension]]
+
+        tables = self.calculate_tables(self.calculate_scores(objective, vertical_display_pos, angle_range))
+        [prefix, suffix] = tables[:2]
+        bound = np.minimum(prefix[self.m_first_curve, retraction], suffix[self.m_last_curve, extension])
+        order = np.argsort(-bound, kind='stable')
+        machine = (self.m_drawer.m_p1_pos, self.m_drawer.m_p2_pos, self.m_drawer.m_p3_pos)
+
+        best = pd.DataFrame(columns=['Retraction', 'Extension', 'Profile', 'Score', 'Mean'])
+        self.m_evaluated_pairs = 0
+        self.m_total_pairs = len(order) * len(motion_profiles)
+        self.m_best_score = -np.inf
+        self.m_best_ties = 0
+        executor = ProcessPoolExecutor(max_workers=processes) if processes > 1 else None
+        try:
+            for motion_profile in motion_profiles:
+                chunks = [order[begin:begin + chunk_size] for begin in range(0, len(order), chunk_size)]
+                while len(chunks) > 0:
+                    threshold = best['Score'].iat[top - 1] if len(best) >= top else -np.inf
+                    # the chunks are sorted by bound, a wave is as many chunks as there are workers.
+                    # pairs which may tie with the top are still evaluated, for their mean score and to count the ties
+                    wave = [chunk[bound[chunk] >= threshold] for chunk in chunks[:processes]]
+                    chunks = chunks[processes:]
+                    wave = [chunk for chunk in wave if len(chunk) > 0]
+                    if len(wave) == 0:
+                        break
+                    arguments = [(machine, self.m_curve_size, motion_profile, self.m_angles, tables, retraction[chunk], extension[chunk]) for chunk in wave]
+                    if executor is None:
+                        scores = [score_motion_windows(*argument) for argument in arguments]
+                    else:
+                        scores = list(executor.map(score_motion_windows, *zip(*arguments)))
+                    for [chunk, [score, mean]] in zip(wave, scores):
+                        self.m_evaluated_pairs += len(chunk)
+                        if score.max() > self.m_best_score:
+                            self.m_best_score = float(score.max())
+                            self.m_best_ties = 0
+                        self.m_best_ties += int(np.count_nonzero(score == self.m_best_score))
+                        found = pd.DataFrame({ 'Retraction': self.m_angles[retraction[chunk]],
+                                             'Extension': self.m_angles[extension[chunk]],
+                                             'Profile': motion_profile,
+                                             'Score': score,
+                                             'Mean': mean })
+                        found = found.sort_values(['Score', 'Mean'], ascending=False, kind='stable').head(top)
+                        best = pd.concat([best, found] if len(best) > 0 else [found])
+                        best = best.sort_values(['Score', 'Mean'], ascending=False, kind='stable').head(top).reset_index(drop=True)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return best
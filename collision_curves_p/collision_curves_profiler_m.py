@@ -0,0 +1,70 @@
+from collections import defaultdict
+from contextlib import contextmanager
+import functools
+import time
+
+
+class collision_curves_profiler():
+    """
+    optional timing hooks for the hot paths of the generator and the drawer, off by default.
+    in the notebook:
+        ccp.profiler.enable()
+        ... move some widgets ...
+        ccp.profiler.report()
+    """
+    def __init__(self):
+        self.m_enabled = False
+        self.m_timings = defaultdict(list)
+
+    def enable(self):
+        self.m_enabled = True
+
+    def disable(self):
+        self.m_enabled = False
+
+    def reset(self):
+        self.m_timings.clear()
+
+    @contextmanager
+    def section(self, name):
+        if not self.m_enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.m_timings[name].append(time.perf_counter() - start)
+
+    def timed(self, name):
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.m_enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.m_timings[name].append(time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def report(self):
+        """
+        one row per instrumented section, times in milliseconds, slowest total first
+        """
+        import pandas as pd
+        rows = []
+        for [name, timings] in self.m_timings.items():
+            rows.append({ 'Section': name,
+                        'Calls': len(timings),
+                        'Total(ms)': sum(timings) * 1e3,
+                        'Mean(ms)': sum(timings) / len(timings) * 1e3,
+                        'Max(ms)': max(timings) * 1e3 })
+        report = pd.DataFrame(rows, columns=['Section', 'Calls', 'Total(ms)', 'Mean(ms)', 'Max(ms)'])
+        return report.sort_values('Total(ms)', ascending=False).reset_index(drop=True)
+
+
+# shared by every instrumented method
+profiler = collision_curves_profiler()
@@ -0,0 +1,204 @@
+import io
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import numpy as np
+import collision_curves_p.collision_curves_profiler_m as ccp
+
+
+class collision_curves_renderer():
+    """
+    keeps one figure and its artists alive across frames of the drawer, each frame only updates
+    the data, alpha, markers and texts in place. headless renderers draw on a plain Agg canvas
+    and never touch pyplot or Jupyter
+    """
+    def __init__(self, headless=False, figsize=(6.4, 4.8), dpi=100):
+        self.m_headless = headless
+        backend = matplotlib.get_backend().lower()
+        # only gui and widget backends can update a canvas which is already on screen
+        self.m_is_live_canvas = (headless == False) and ('inline' not in backend) and (backend != 'agg')
+        if self.m_is_live_canvas:
+            import pylab as pl
+            self.m_figure = pl.figure(figsize=figsize, dpi=dpi)
+        else:
+            self.m_figure = Figure(figsize=figsize, dpi=dpi)
+            FigureCanvasAgg(self.m_figure)
+        self.m_axes = self.m_figure.add_subplot(1, 1, 1)
+        self.m_background = None
+
+        axes = self.m_axes
+        axes.set_xticks(np.arange(-300, 300, 50))
+        axes.set_yticks(np.arange(-25, 450, 25))
+        axes.set_xlabel('Angle(1/10 Degrees)')
+        axes.set_ylabel('Vertical(mm)')
+        axes.set_xlim(-330, 330)
+        axes.set_ylim(450, -25)
+        axes.grid(True)
+
+        # static decorations, moved in place when the bore down limit changes
+        [self.m_bore_down_line] = axes.plot([-300, 300], [np.nan, np.nan], color='purple', alpha=1.0, linestyle='--')
+        self.m_bore_down_text = axes.text(80, 0, '', color='purple')
+        [self.m_iso_center_line] = axes.plot([-300, 300], [np.nan, np.nan], color='purple', alpha=1.0, linestyle='--')
+        self.m_iso_center_text = axes.text(-290, 0, '', color='purple')
+
+        # motion window of the sub pallet
+        [self.m_retraction_line] = axes.plot([np.nan, np.nan], [400, 120], color='blue', alpha=0.75, linestyle='--')
+        [self.m_extension_line] = axes.plot([np.nan, np.nan], [400, 120], color='blue', alpha=0.75, linestyle='--')
+        self.m_motion_window_text = axes.text(0, 200, 'motion window', color='blue', alpha=0.75)
+
+        # the per frame artists, drawn on top of the cached background when the canvas can blit
+        self.m_curve_lines = []
+        self.m_curve_names = None
+        [self.m_point] = axes.plot([0], [0], marker='o', animated=self.m_is_live_canvas)
+        self.m_point_text = axes.text(0, 0, '', animated=self.m_is_live_canvas)
+        self.m_marks = []
+        self.m_title = axes.set_title('', fontsize=10)
+        self.m_title.set_animated(self.m_is_live_canvas)
+
+    def set_curves(self, curves):
+        """
+        curves: list of [name, angles, upper, down, color, alpha]
+        """
+        names = [curve[0] for curve in curves]
+        # the legend copies the alpha of the lines when it is built, so it is rebuilt whenever one changes
+        is_legend_stale = False
+        if names != self.m_curve_names:
+            # the family changed, rebuild the line pairs
+            for [down_line, upper_line] in self.m_curve_lines:
+                down_line.remove()
+                upper_line.remove()
+            self.m_curve_lines = []
+            for [name, angles, upper, down, color, alpha] in curves:
+                [down_line] = self.m_axes.plot(angles, down, label=f'{name} down', color=color, alpha=alpha) # x=angle, y=down
+                [upper_line] = self.m_axes.plot(angles, upper, label=f'{name} upper', color=color, alpha=alpha) # x=angle, y=upper
+                self.m_curve_lines.append([down_line, upper_line])
+            self.m_curve_names = names
+            self.m_background = None
+            is_legend_stale = True
+
+        for [[name, angles, upper, down, color, alpha], [down_line, upper_line]] in zip(curves, self.m_curve_lines):
+            if not (np.array_equal(down_line.get_xdata(), angles) and np.array_equal(down_line.get_ydata(), down) and np.array_equal(upper_line.get_ydata(), upper)):
+                down_line.set_data(angles, down)
+                upper_line.set_data(angles, upper)
+                # same name, new data: the continuous curve follows the sub pallet, or an envelope was updated
+                self.m_background = None
+            if down_line.get_alpha() != alpha:
+                down_line.set_alpha(alpha)
+                upper_line.set_alpha(alpha)
+                # the highlighted curve moved, the cached background is stale
+                self.m_background = None
+                is_legend_stale = True
+
+        if is_legend_stale:
+            if len(self.m_curve_lines) > 0:
+                self.m_axes.legend(loc='lower left')
+            elif self.m_axes.get_legend() is not None:
+                self.m_axes.get_legend().remove()
+
+    def set_horizontal_lines(self, bore_down_limit, iso_center):
+        if self.m_bore_down_line.get_ydata()[0] != bore_down_limit or self.m_iso_center_line.get_ydata()[0] != iso_center:
+            self.m_bore_down_line.set_ydata([bore_down_limit, bore_down_limit])
+            self.m_bore_down_text.set_text(f'bore down limit({bore_down_limit} mm)')
+            self.m_bore_down_text.set_y(bore_down_limit+15)
+            self.m_iso_center_line.set_ydata([iso_center, iso_center])
+            self.m_iso_center_text.set_text(f'ISO center({iso_center} mm)')
+            self.m_iso_center_text.set_y(iso_center-8)
+            self.m_background = None
+
+    def set_motion_window(self, motion_window_of_angle):
+        visible = motion_window_of_angle is not None
+        if visible:
+            [retraction_angle, extension_angle] = motion_window_of_angle
+            if list(self.m_retraction_line.get_xdata()) != [retraction_angle, retraction_angle] or list(self.m_extension_line.get_xdata()) != [extension_angle, extension_angle]:
+                self.m_retraction_line.set_xdata([retraction_angle, retraction_angle])
+                self.m_extension_line.set_xdata([extension_angle, extension_angle])
+                self.m_motion_window_text.set_x(retraction_angle-150)
+                self.m_background = None
+        if self.m_retraction_line.get_visible() != visible:
+            for artist in [self.m_retraction_line, self.m_extension_line, self.m_motion_window_text]:
+                artist.set_visible(visible)
+            self.m_background = None
+
+    def set_point(self, x, y, color, markerfacecolor, offset, text):
+        self.m_point.set_data([x], [y])
+        self.m_point.set_color(color)
+        self.m_point.set_markerfacecolor(markerfacecolor)
+        self.m_point_text.set_position((x + offset[0], y + offset[1]))
+        self.m_point_text.set_text(text)
+        self.m_point_text.set_color(color)
+
+    def set_marks(self, marks):
+        """
+        marks: list of [x, y, color, alpha, offset, text], extra pooled artists are hidden
+        """
+        while len(self.m_marks) < len(marks):
+            [mark] = self.m_axes.plot([0], [0], marker='.', markerfacecolor='none', animated=self.m_is_live_canvas)
+            mark_text = self.m_axes.text(0, 0, '', animated=self.m_is_live_canvas)
+            self.m_marks.append([mark, mark_text])
+        for index in range(len(self.m_marks)):
+            [mark, mark_text] = self.m_marks[index]
+            visible = index < len(marks)
+            mark.set_visible(visible)
+            mark_text.set_visible(visible)
+            if visible:
+                [x, y, color, alpha, offset, text] = marks[index]
+                mark.set_data([x], [y])
+                mark.set_color(color)
+                mark.set_alpha(alpha)
+                mark_text.set_position((x + offset[0], y + offset[1]))
+                mark_text.set_text(text)
+                mark_text.set_color(color)
+                mark_text.set_alpha(alpha)
+
+    def set_title(self, title):
+        self.m_title.set_text(title)
+
+    @ccp.profiler.timed('renderer.draw_frame')
+    def draw_frame(self, frame):
+        self.set_horizontal_lines(frame['bore_down_limit'], frame['iso_center'])
+        self.set_curves(frame['curves'])
+        self.set_motion_window(frame['motion_window_of_angle'])
+        self.set_point(*frame['point'])
+        self.set_marks(frame['marks'])
+        self.set_title(frame['title'])
+
+    def animated_artists(self):
+        artists = [self.m_point, self.m_point_text, self.m_title]
+        for [mark, mark_text] in self.m_marks:
+            artists += [mark, mark_text]
+        return artists
+
+    @ccp.profiler.timed('renderer.show')
+    def show(self):
+        canvas = self.m_figure.canvas
+        if self.m_is_live_canvas:
+            if canvas.supports_blit:
+                if self.m_background is None:
+                    # full redraw of the static artists, then cache them as the background
+                    canvas.draw()
+                    self.m_background = canvas.copy_from_bbox(self.m_figure.bbox)
+                canvas.restore_region(self.m_background)
+                for artist in self.animated_artists():
+                    if artist.get_visible():
+                        self.m_axes.draw_artist(artist)
+                canvas.blit(self.m_figure.bbox)
+                canvas.flush_events()
+            else:
+                canvas.draw_idle()
+        elif self.m_headless == False:
+            import sys
+            if 'ipykernel' in sys.modules:
+                from IPython.display import display
+                display(self.m_figure)
+
+    @ccp.profiler.timed('renderer.to_png')
+    def to_png(self):
+        # savefig skips animated artists, they are only animated for blitting on live canvases
+        artists = self.animated_artists()
+        for artist in artists:
+            artist.set_animated(False)
+        buffer = io.BytesIO()
+        self.m_figure.savefig(buffer, format='png')
+        for artist in artists:
+            artist.set_animated(self.m_is_live_canvas)
+        return buffer.getvalue()
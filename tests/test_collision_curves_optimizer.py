@@ -0,0 +1,62 @@
+import itertools
+import os
+import numpy as np
+import pytest
+import collision_curves_p.collision_curves_drawer_m as ccd
+import collision_curves_p.collision_curves_generator_m as ccg
+import collision_curves_p.collision_curves_optimizer_m as cco
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+
+@pytest.fixture(scope='module')
+def drawer():
+    generator = ccg.collision_curves_generator(os.path.join(DATA_DIR, 'noah_rt_collision_envelope_p1.csv'),
+                                               os.path.join(DATA_DIR, 'noah_rt_collision_envelope_p2.csv'))
+    return ccd.collision_curves_drawer(0, 100, 150, 400, 300, generator, True)
+
+
+def brute_force(optimizer, objective, motion_profiles, window_angles, angle_range):
+    # [retraction, extension, profile, worst score, mean score] of every window, straight from the lookups of the drawer
+    windows = []
+    for motion_profile in motion_profiles:
+        for [retraction, extension] in itertools.combinations(window_angles, 2):
+            scores = optimizer.calculate_window_scores((retraction, extension), objective, motion_profile=motion_profile, angle_range=angle_range)
+            windows.append([retraction, extension, motion_profile, scores.min(), scores[np.isfinite(scores)].mean()])
+    return windows
+
+
+@pytest.mark.parametrize('curve_size, objective, window_angles, angle_range, processes', [
+    (10, 'range', np.arange(0, 301, 10.0), None, 1),
+    (10, 'range', np.arange(0, 301, 10.0), (-300, 300), 1),
+    (6, 'clearance', np.arange(0, 201, 20.0), None, 2),
+    (4, 'clearance', np.arange(0, 101, 5.0), (0, 200), 1),
+])
+def test_optimize_matches_brute_force(drawer, curve_size, objective, window_angles, angle_range, processes):
+    optimizer = cco.collision_curves_window_optimizer(drawer, curve_size, 400)
+    motion_profiles = tuple(drawer.m_motion_profiles)
+    best = optimizer.optimize(objective, motion_profiles=motion_profiles, window_angles=window_angles, angle_range=angle_range,
+                              top=5, processes=processes, chunk_size=37)
+    if angle_range is None:
+        assert optimizer.m_angle_range == (window_angles[0], window_angles[-1])
+
+    windows = brute_force(optimizer, objective, motion_profiles, window_angles, optimizer.m_angle_range)
+    worst = np.array([window[3] for window in windows])
+    assert optimizer.m_best_score == worst.max()
+    assert optimizer.m_best_ties == np.count_nonzero(worst == worst.max())
+
+    # every window returned is scored like the drawer scores it, and the top is the top of the brute force
+    by_window = { (retraction, extension, profile): [score, mean] for [retraction, extension, profile, score, mean] in windows }
+    for row in best.itertuples():
+        [score, mean] = by_window[(row.Retraction, row.Extension, row.Profile)]
+        assert row.Score == score
+        assert row.Mean == pytest.approx(mean, abs=1e-9)
+    ranked = sorted(windows, key=lambda window: (window[3], window[4]), reverse=True)[:len(best)]
+    assert best['Score'].tolist() == [window[3] for window in ranked]
+    assert best['Mean'].to_numpy() == pytest.approx([window[4] for window in ranked], abs=1e-9)
+
+
+def test_optimize_leaves_the_current_family_alone(drawer):
+    drawer.m_generator.build_collision_curves(3)
+    cco.collision_curves_window_optimizer(drawer, 8, 400).optimize('range', window_angles=np.arange(0, 101, 20.0))
+    assert len(drawer.m_generator.m_collision_curves_index) == 3